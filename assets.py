@@ -0,0 +1,32 @@
+import os
+import pygame
+
+
+ASSET_DIRECTORY = 'resources'
+
+# Images by file name, as they were loaded from the resources folder
+images = {}
+# Scaled copies by (file name, (width, height)), shared by every sprite and menu that uses that size
+# Nothing draws onto them, they are only ever blitted
+scaled_images = {}
+# Keys of the scaled images that are in the display's pixel format
+converted_images = set()
+
+
+def load_image(name):
+    if name not in images:
+        images[name] = pygame.image.load(os.path.join(ASSET_DIRECTORY, name))
+    return images[name]
+
+
+# Returns the image scaled to size, converted to the display's pixel format so blitting it doesn't have to convert every pixel
+def get_image(name, size):
+    key = (name, (int(size[0]), int(size[1])))
+    if key not in scaled_images:
+        scaled_images[key] = pygame.transform.scale(load_image(name), key[1])
+
+    # headless games have no display to convert to, and an image scaled before the window opened is converted once it has
+    if key not in converted_images and pygame.display.get_surface() is not None:
+        scaled_images[key] = scaled_images[key].convert_alpha()
+        converted_images.add(key)
+    return scaled_images[key]
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import numpy as np
+from numpy import int8
+from bitboard import BitBoard
+from engine import Engine
+from evaluation import IncrementalEvaluation
+from move_ordering import MoveOrderer
+from trajectory import PathPredictor, ShotSolver
+import calibration_cache
+
+
+BENCHMARK_VERSION = 1
+BENCHMARKS = ('minimax', 'score_position', 'cpu_detect_win', 'board_detect_win', 'score_point_board', 'configure', 'configure_cached', 'get_checkpoints')
+# The same range of boards the custom game mode menu allows
+MIN_ROWS, MAX_ROWS = 3, 7
+MIN_COLS, MAX_COLS = 3, 8
+
+
+# Custom games start on connect 4, boards too small for that connect as many as they can fit
+def get_sizes():
+    return [(rows, cols, min(4, max(rows, cols))) for rows in range(MIN_ROWS, MAX_ROWS + 1) for cols in range(MIN_COLS, MAX_COLS + 1)]
+
+
+# Sizes are given as rows x columns x connect amount, like 6x7x4
+def parse_size(text):
+    try:
+        rows, cols, connect_amount = (int(value) for value in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' isn't rows x columns x connect amount")
+    return (rows, cols, connect_amount)
+
+
+# Positions are played out at random from a seed made from the board size, so every run benchmarks the same ones
+# Each is (bitboard, matrix like Board.filled_spaces, (row, column) of the last disc), none of them already won
+def get_positions(rows, cols, connect_amount, count, seed):
+    rng = random.Random(f"{seed}/{rows}x{cols}x{connect_amount}")
+    positions = []
+    while len(positions) < count:
+        position = BitBoard(rows, cols, connect_amount)
+        matrix = np.zeros((rows, cols), dtype=int8)
+        last_move = None
+        # yellow moves first, like in the game
+        piece = 2
+        for _ in range(rng.randrange(1, rows*cols)):
+            col = rng.choice(position.valid_cols())
+            move = (rows-1 - position.heights[col], col)
+            position.play(col, piece)
+            # a move that ends the game is taken back and the position stops there
+            if position.is_win(piece) or position.is_full():
+                position.undo()
+                break
+            matrix[move] = piece
+            last_move = move
+            piece = 1 if piece == 2 else 2
+        if last_move:
+            positions.append((position, matrix, last_move))
+    return positions
+
+
+# Seconds each call takes in every round, a round repeats func until it has run for at least min_time
+# With setup, it runs before every call and isn't timed, so each call is timed on its own
+def measure(func, setup=None, repeat=5, min_time=0.02):
+    rounds = []
+    for _ in range(repeat):
+        calls = 0
+        elapsed = 0
+        while elapsed < min_time:
+            if setup:
+                setup()
+                start_time = time.perf_counter()
+                func()
+                elapsed += time.perf_counter() - start_time
+                calls += 1
+            else:
+                number = max(1, calls)
+                start_time = time.perf_counter()
+                for _ in range(number):
+                    func()
+                elapsed += time.perf_counter() - start_time
+                calls += number
+        rounds.append(elapsed / calls)
+    return rounds
+
+
+# A headless game with a board of every size, only built if a benchmark needs pygame
+class GameBoards:
+    def __init__(self):
+        # imported here so the engine benchmarks never need pygame
+        from game import Catapult_4
+        self.game = Catapult_4(1200, 600, headless=True)
+        self.game.vs_cpu = False
+
+    def get_board(self, rows, cols, connect_amount):
+        game = self.game
+        game.game_mode = (rows, cols, connect_amount)
+        game.playing = False
+        game.reset()
+        return game.board
+
+    def get_cpu(self, rows, cols, connect_amount):
+        from cpu import CPU
+        self.get_board(rows, cols, connect_amount)
+        return CPU(self.game, self.game.RED_PIECE, self.game.RED_SPAWN, 'easy', workers=1)
+
+
+def run_size(rows, cols, connect_amount, benchmarks, args, game_boards):
+    results = {}
+    positions = get_positions(rows, cols, connect_amount, args.positions, args.seed)
+    engines = {piece : Engine(rows, cols, connect_amount, piece, 'extreme', tt_megabytes=1, workers=1) for piece in (1, 2)}
+    # whoever didn't play last is to move, yellow moves first
+    movers = [(engines[1 if position.moves_played % 2 else 2], position) for position, _, _ in positions]
+
+    def record(name, rounds, per_call=1):
+        results[f"{name}/{rows}x{cols}x{connect_amount}"] = {
+            'benchmark' : name,
+            'size' : [rows, cols, connect_amount],
+            'median' : statistics.median(rounds) / per_call,
+            'min' : min(rounds) / per_call
+        }
+
+    if 'minimax' in benchmarks:
+        for position, _, _ in positions:
+            engine = engines[1 if position.moves_played % 2 else 2]
+            position.evaluation = IncrementalEvaluation(engine, position, engine.CPU_PIECE)
+
+        for depth in range(1, args.max_depth + 1):
+            # every call starts from empty tables, otherwise later calls would just read back the first one's results
+            def setup():
+                for engine in engines.values():
+                    engine.transposition_table.clear()
+                    engine.move_orderer = MoveOrderer(engine.point_board)
+                    engine.stopped = False
+                    engine.deadline = None
+                    engine.node_limit = None
+            def search():
+                for engine, position in movers:
+                    engine.minimax(position, depth, -engines[1].WIN_SCORE*2, engines[1].WIN_SCORE*2, True)
+            record(f"minimax_depth_{depth}", measure(search, setup, args.repeat, args.min_time), len(movers))
+
+    if 'score_position' in benchmarks:
+        def score():
+            for engine, position in movers:
+                engine.score_position(position, engine.CPU_PIECE)
+        record('score_position', measure(score, None, args.repeat, args.min_time), len(movers))
+
+    if 'cpu_detect_win' in benchmarks:
+        def detect():
+            for engine, position in movers:
+                engine.detect_win(position, engine.PLAYER_PIECE)
+        record('cpu_detect_win', measure(detect, None, args.repeat, args.min_time), len(movers))
+
+    if 'board_detect_win' in benchmarks:
+        board = game_boards.get_board(rows, cols, connect_amount)
+        board_positions = [(matrix, last_move) for _, matrix, last_move in positions]
+        def detect():
+            for matrix, last_move in board_positions:
+                board.filled_spaces = matrix
+                board.last_move = last_move
+                board.detect_win(matrix[last_move])
+        record('board_detect_win', measure(detect, None, args.repeat, args.min_time), len(board_positions))
+
+    if 'score_point_board' in benchmarks:
+        record('score_point_board', measure(engines[1].score_point_board, None, args.repeat, args.min_time))
+
+    if 'configure' in benchmarks or 'configure_cached' in benchmarks or 'get_checkpoints' in benchmarks:
+        cpu = game_boards.get_cpu(rows, cols, connect_amount)
+        game = game_boards.game
+        configure_args = (game.VERT_GRAVITY_VAL, game.DAMPING_VAL, game.disc_launch_factor, game.aim_line_max_dis, cpu.board.SLOT_SIZE)
+
+        if 'configure' in benchmarks:
+            # the calibration cache is emptied before every call, so this times working the moves out
+            # saving is turned off while it runs, otherwise every call would also rewrite the whole file
+            save_calibrations = calibration_cache.save_calibrations
+            calibration_cache.save_calibrations = lambda: None
+            try:
+                record('configure', measure(lambda: cpu.configure(*configure_args), calibration_cache.calibrations.clear, args.repeat, args.min_time))
+            finally:
+                calibration_cache.save_calibrations = save_calibrations
+        if 'configure_cached' in benchmarks:
+            record('configure_cached', measure(lambda: cpu.configure(*configure_args), None, args.repeat, args.min_time))
+
+        if 'get_checkpoints' in benchmarks:
+            # the velocity of the shot into each column
+            shot_solver = ShotSolver(game.VERT_GRAVITY_VAL, game.DAMPING_VAL, cpu.piece_spawn, 0.05)
+            velocities = [shot_solver.get_velocity(target) for target in cpu.target_points]
+            def predict():
+                for velocity in velocities:
+                    PathPredictor(game.VERT_GRAVITY_VAL, game.DAMPING_VAL, cpu.piece_spawn, velocity).get_checkpoints()
+            record('get_checkpoints', measure(predict, None, args.repeat, args.min_time), len(velocities))
+
+    return results
+
+
+def run_benchmarks(args):
+    benchmarks = args.only or BENCHMARKS
+    # calibrations made while benchmarking go to a file of their own rather than the game's
+    calibration_cache.CALIBRATION_PATH = os.path.join('cache', 'benchmark_calibration.json')
+    game_boards = None
+    if any(name in benchmarks for name in ('board_detect_win', 'configure', 'configure_cached', 'get_checkpoints')):
+        game_boards = GameBoards()
+
+    results = {}
+    for rows, cols, connect_amount in args.sizes or get_sizes():
+        start_time = time.perf_counter()
+        results.update(run_size(rows, cols, connect_amount, benchmarks, args, game_boards))
+        print(f"{rows}x{cols}x{connect_amount} done in {time.perf_counter() - start_time:.1f}s", file=sys.stderr)
+
+    return {
+        'version' : BENCHMARK_VERSION,
+        'seed' : args.seed,
+        'positions' : args.positions,
+        'python' : platform.python_version(),
+        'machine' : platform.machine(),
+        'results' : results
+    }
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds*1e6:.2f}us"
+    if seconds < 1:
+        return f"{seconds*1e3:.2f}ms"
+    return f"{seconds:.2f}s"
+
+
+def print_results(report):
+    for key, result in report['results'].items():
+        print(f"{key:<32} {format_time(result['median']):>12} {format_time(result['min']):>12}")
+
+
+# Compares median times against a baseline report, returns the keys that got slower by more than the tolerance
+def compare(report, baseline, tolerance):
+    regressions = []
+    for key, result in report['results'].items():
+        if key not in baseline['results']:
+            continue
+        old_time = baseline['results'][key]['median']
+        ratio = result['median'] / old_time if old_time else 1
+        if ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions.append(key)
+        elif ratio < 1 - tolerance:
+            flag = 'faster'
+        else:
+            flag = ''
+        print(f"{key:<32} {format_time(old_time):>12} {format_time(result['median']):>12} {ratio:>7.2f}x {flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times the engine and physics hot paths on reproducible positions')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='benchmarks to run, all of them by default')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, help='boards like 6x7x4, every custom game size by default')
+    parser.add_argument('--max-depth', type=int, default=4, help='deepest minimax benchmark')
+    parser.add_argument('--positions', type=int, default=8, help='positions on each board')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='rounds of each benchmark, the median round is reported')
+    parser.add_argument('--min-time', type=float, default=0.02, help='seconds each round runs for at least')
+    parser.add_argument('--output', default=os.path.join('cache', 'benchmark.json'), help='file the results are written to')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='fraction slower than the baseline that counts as a regression')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('version') != BENCHMARK_VERSION or baseline.get('seed') != report['seed'] or baseline.get('positions') != report['positions']:
+            print('The baseline was run with a different version, seed or number of positions, so its times may not be comparable')
+        print(f"{'benchmark':<32} {'baseline':>12} {'now':>12} {'ratio':>8}")
+        regressions = compare(report, baseline, args.tolerance)
+        print(f"{len(regressions)} regressions, results written to {args.output}")
+        sys.exit(1 if regressions else 0)
+
+    print(f"{'benchmark':<32} {'median':>12} {'min':>12}")
+    print_results(report)
+    print(f"Results written to {args.output}")
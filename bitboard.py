@@ -0,0 +1,186 @@
+from transposition import get_zobrist_keys
+
+# int.bit_count only exists from python 3.10
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(x):
+        return bin(x).count('1')
+
+
+# Compact copy of the board's matrix for the cpu's search
+# Each column is stored bottom up in its own block of (rows + 1) bits, the extra bit on top is always empty
+# so that lines can't wrap around from one column into the next
+class BitBoard:
+    def __init__(self, rows, cols, connect_amount):
+        self.rows = rows
+        self.cols = cols
+        self.connect_amount = connect_amount
+        self.col_height = self.rows + 1
+
+        # One mask per piece, index 0 is unused so they line up with the values in the board's matrix
+        self.masks = [0, 0, 0]
+        # Number of discs in each column
+        self.heights = [0] * self.cols
+        self.moves_played = 0
+        # Columns played into since the bitboard was made, so moves can be undone in order without allocating anything
+        self.move_stack = [0] * (self.rows * self.cols)
+        self.stack_size = 0
+        # Bit and piece of the most recent move, 0 when it isn't known
+        self.last_bit = 0
+        self.last_piece = 0
+
+        # Zobrist hash of the pieces on the board, updated as pieces are played
+        self.zobrist_keys = get_zobrist_keys(self.rows, self.cols)[0]
+        self.hash = 0
+
+        # Optional IncrementalEvaluation kept up to date by play and undo
+        self.evaluation = None
+
+        # Bit shifts to move one cell along a vertical, horizontal, positive diagonal and negative diagonal line
+        self.directions = (1, self.col_height, self.col_height + 1, self.col_height - 1)
+
+    # Builds a bitboard from a matrix like Board.filled_spaces, where row 0 is the top of the board
+    @classmethod
+    def from_matrix(cls, board_matrix, connect_amount):
+        rows, cols = board_matrix.shape
+        position = cls(rows, cols, connect_amount)
+        # the order the pieces were played in isn't known, so they are placed without going onto the move stack
+        for j in range(cols):
+            for i in range(rows-1, -1, -1):
+                piece = int(board_matrix[i, j])
+                if piece == 0:
+                    break
+                index = position.cell_index(i, j)
+                position.masks[piece] |= 1 << index
+                position.hash ^= position.zobrist_keys[piece][index]
+                position.heights[j] += 1
+                position.moves_played += 1
+        return position
+
+    # Builds a bitboard straight from the two masks, which is how positions are sent between processes
+    @classmethod
+    def from_masks(cls, rows, cols, connect_amount, red_mask, yellow_mask):
+        position = cls(rows, cols, connect_amount)
+        for piece, mask in ((1, red_mask), (2, yellow_mask)):
+            position.masks[piece] = mask
+            for index in range(cols * position.col_height):
+                if mask >> index & 1:
+                    position.hash ^= position.zobrist_keys[piece][index]
+                    position.heights[index // position.col_height] += 1
+                    position.moves_played += 1
+        return position
+
+    def copy(self):
+        position = BitBoard.__new__(BitBoard)
+        position.rows = self.rows
+        position.cols = self.cols
+        position.connect_amount = self.connect_amount
+        position.col_height = self.col_height
+        position.masks = self.masks[:]
+        position.heights = self.heights[:]
+        position.moves_played = self.moves_played
+        position.move_stack = self.move_stack[:]
+        position.stack_size = self.stack_size
+        position.last_bit = self.last_bit
+        position.last_piece = self.last_piece
+        position.zobrist_keys = self.zobrist_keys
+        position.hash = self.hash
+        position.evaluation = None
+        position.directions = self.directions
+        return position
+
+    # The same position flipped left to right
+    def mirrored(self):
+        col_mask = (1 << self.col_height) - 1
+        masks = [0, 0]
+        for i, piece in enumerate((1, 2)):
+            for col in range(self.cols):
+                column = (self.masks[piece] >> (col*self.col_height)) & col_mask
+                masks[i] |= column << ((self.cols-1 - col)*self.col_height)
+        return BitBoard.from_masks(self.rows, self.cols, self.connect_amount, masks[0], masks[1])
+
+    # Index of a cell's bit, with the cell given in the same (row, column) form as the board's matrix
+    def cell_index(self, row, col):
+        return col*self.col_height + self.rows-1 - row
+
+    def cell_bit(self, row, col):
+        return 1 << self.cell_index(row, col)
+
+    def can_play(self, col):
+        return self.heights[col] < self.rows
+
+    # Picks all columns not full
+    def valid_cols(self):
+        return [col for col in range(self.cols) if self.heights[col] < self.rows]
+
+    # Drops a piece into a column
+    def play(self, col, piece):
+        index = col*self.col_height + self.heights[col]
+        self.last_bit = 1 << index
+        self.last_piece = piece
+        self.masks[piece] |= self.last_bit
+        self.hash ^= self.zobrist_keys[piece][index]
+        self.heights[col] += 1
+        self.moves_played += 1
+        self.move_stack[self.stack_size] = col
+        self.stack_size += 1
+        if self.evaluation:
+            self.evaluation.add(index, piece)
+
+    # Takes back the most recent move
+    def undo(self):
+        self.stack_size -= 1
+        col = self.move_stack[self.stack_size]
+        self.heights[col] -= 1
+        self.moves_played -= 1
+        index = col*self.col_height + self.heights[col]
+        bit = 1 << index
+        piece = 1 if self.masks[1] & bit else 2
+        self.masks[piece] ^= bit
+        self.hash ^= self.zobrist_keys[piece][index]
+        if self.evaluation:
+            self.evaluation.remove(index, piece)
+
+        # The move before is still on top of its column
+        if self.stack_size:
+            col = self.move_stack[self.stack_size - 1]
+            self.last_bit = 1 << (col*self.col_height + self.heights[col] - 1)
+            self.last_piece = 1 if self.masks[1] & self.last_bit else 2
+        else:
+            self.last_bit = 0
+            self.last_piece = 0
+
+    def is_full(self):
+        return self.moves_played == self.rows * self.cols
+
+    def is_win(self, piece):
+        mask = self.masks[piece]
+        for shift in self.directions:
+            # Leaves only the bits that start a line of connect_amount pieces
+            line = mask
+            for n in range(1, self.connect_amount):
+                line &= mask >> (n*shift)
+                if not line:
+                    break
+            if line:
+                return True
+        return False
+
+    # Only checks the lines going through one cell, so it is much cheaper than is_win after a single move
+    def wins_through(self, bit, piece):
+        mask = self.masks[piece]
+        for shift in self.directions:
+            count = 1
+            # walks both ways along the line until it leaves the piece's discs
+            neighbour = bit << shift
+            while neighbour & mask:
+                count += 1
+                neighbour <<= shift
+            neighbour = bit >> shift
+            while neighbour & mask:
+                count += 1
+                neighbour >>= shift
+            if count >= self.connect_amount:
+                return True
+        return False
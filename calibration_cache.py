@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import tempfile
+
+
+# Bump whenever the calibration or the path prediction changes, older files are then ignored and rebuilt
+CALIBRATION_VERSION = 3
+CALIBRATION_PATH = os.path.join('cache', 'cpu_calibration.json')
+
+# Calibrations by key, kept for as long as the game is open
+calibrations = {}
+# Whether the file on disk has been read into calibrations yet
+loaded_from_disk = False
+
+
+# Every input the calibration depends on goes into the key, so a different window size or mode gets its own entry
+def get_calibration_key(*inputs):
+    return hashlib.sha1(repr((CALIBRATION_VERSION,) + inputs).encode()).hexdigest()
+
+
+def load_calibrations():
+    global loaded_from_disk
+    loaded_from_disk = True
+    try:
+        with open(CALIBRATION_PATH) as file:
+            saved = json.load(file)
+    # a missing or broken file just means calibrating again
+    except (OSError, ValueError):
+        return
+    if not isinstance(saved, dict) or saved.get('version') != CALIBRATION_VERSION:
+        return
+    for key, calibration in saved.get('calibrations', {}).items():
+        calibrations.setdefault(key, calibration)
+
+
+def save_calibrations():
+    temp_path = None
+    try:
+        directory = os.path.dirname(CALIBRATION_PATH)
+        os.makedirs(directory, exist_ok=True)
+        # written to a temporary file first so a crash never leaves half a file behind
+        # each save gets its own, so processes saving at the same time, like a tournament's workers, never write into each other's
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(CALIBRATION_PATH), suffix='.tmp')
+        with os.fdopen(handle, 'w') as file:
+            json.dump({'version' : CALIBRATION_VERSION, 'calibrations' : calibrations}, file)
+        os.replace(temp_path, CALIBRATION_PATH)
+    # the game still works without the file, it only has to calibrate again next launch
+    except OSError:
+        if temp_path:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+# Returns (moves, mean_x_dif) as CPU.configure would work them out, or None if they haven't been yet
+def get_calibration(key):
+    if not loaded_from_disk:
+        load_calibrations()
+    calibration = calibrations.get(key)
+    if calibration is None:
+        return None
+    moves = {col : tuple(move) for col, move in enumerate(calibration['moves'])}
+    return moves, calibration['mean_x_dif']
+
+
+def store_calibration(key, moves, mean_x_dif):
+    if not loaded_from_disk:
+        load_calibrations()
+    calibrations[key] = {
+        'moves' : [list(moves[col]) for col in range(len(moves))],
+        'mean_x_dif' : mean_x_dif
+    }
+    save_calibrations()
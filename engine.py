@@ -0,0 +1,562 @@
+import math
+import time
+import random
+import os
+import itertools
+import concurrent.futures
+import multiprocessing
+import numpy as np
+from numpy import int8
+from bitboard import BitBoard
+from transposition import TranspositionTable, get_zobrist_keys
+from move_ordering import MoveOrderer
+from evaluation import IncrementalEvaluation
+from solver import get_solver
+from opening_book import get_opening_book
+
+
+# Parent class for the CPU, holds everything the minimax search needs without touching pygame
+class Engine:
+    def __init__(self, rows, cols, connect_amount, piece_value, difficulty='medium', tt_megabytes=16, tt_replacement='two_tier', workers=None):
+        self.difficulty = difficulty
+
+        # Number of discs needed in a row to win
+        self.connect_amount = connect_amount
+        self.rows = rows
+        self.cols = cols
+
+        # deepest the minimax search can go, it searches one move deeper at a time until it runs out of budget
+        # medium and easy will also miss on purpose
+        self.difficulty_depths = {
+            'easy' : 1,
+            'medium' : 2,
+            'extreme' : self.rows * self.cols,
+            'perfect' : self.rows * self.cols
+        }
+        self.depth = self.difficulty_depths[self.difficulty]
+
+        # seconds and number of positions the search may use before settling on its deepest finished result
+        # None means that budget isn't limited
+        self.difficulty_time_limits = {
+            'easy' : 0.05,
+            'medium' : 0.1,
+            'extreme' : 0.75,
+            'perfect' : 0.75
+        }
+        self.difficulty_node_limits = {
+            'easy' : None,
+            'medium' : None,
+            'extreme' : None,
+            'perfect' : None
+        }
+        self.time_limit = self.difficulty_time_limits[self.difficulty]
+        self.node_limit = self.difficulty_node_limits[self.difficulty]
+
+        # number of processes the root moves are split between, 1 keeps the whole search in this process
+        self.difficulty_workers = {
+            'easy' : 1,
+            'medium' : 1,
+            'extreme' : os.cpu_count() or 1,
+            'perfect' : os.cpu_count() or 1
+        }
+        self.workers = workers if workers else self.difficulty_workers[self.difficulty]
+        # The worker processes are started now, so the first move's time budget isn't spent starting them
+        if self.workers > 1:
+            start_search_workers(self.workers, self.rows, self.cols, self.connect_amount, piece_value)
+
+        # The perfect cpu tries to solve the game outright first, the minimax search is only its fallback
+        # for positions that can't be solved within this budget, so its moves are only exact once the solver can finish
+        self.solver = get_solver(self.rows, self.cols, self.connect_amount) if self.difficulty == 'perfect' else None
+        self.solver_time_limit = 2.0
+        self.solver_node_limit = None
+        # Positions with more empty cells than this are hardly ever solved within the budget, so the solver isn't tried on them
+        # On the standard board that's the first 12 discs
+        self.solver_max_empty_cells = 30
+
+        # Moves worked out ahead of time for the start of the game
+        # The extreme cpu's book comes from heuristic searches, the perfect cpu's only holds moves the solver proved
+        self.opening_book = get_opening_book(self.rows, self.cols, self.connect_amount, exact=self.difficulty == 'perfect')
+
+        # values in the board's matrix to represent the game's current state
+        self.EMPTY = 0
+        self.CPU_PIECE = piece_value
+        self.PLAYER_PIECE = 1 if self.CPU_PIECE == 2 else 2
+
+        self.point_multiplier = 5
+        # Tables that only depend on the size of the board, shared with every other engine on the same size
+        # Nothing writes to them once they are built
+        tables = self.get_board_tables()
+        self.point_board = tables['point_board']
+        # Bit index of every cell in every possible line of connect_amount cells, one row per line
+        self.window_index = tables['window_index']
+        self.bit_count = tables['bit_count']
+        # Points for each cell of the point board, laid out in bitboard order
+        self.bit_points = tables['bit_points']
+        # Score of a window indexed by [number of pieces][number of opponent pieces]
+        self.segment_scores = tables['segment_scores']
+        # The same scores flattened, indexed by (number of pieces * (connect_amount+1) + number of opponent pieces)
+        self.segment_table = tables['segment_table']
+        # Matrix with a 1 for every cell of every window, multiplying it by the board counts the pieces in every window at once
+        self.window_matrix = tables['window_matrix']
+        # Windows that go through each bit, so a move only has to update the lines it is part of
+        self.cell_windows = tables['cell_windows']
+        self.segment_list = tables['segment_list']
+        self.bit_point_list = tables['bit_point_list']
+
+        # Remembers searched positions for the rest of the game
+        self.transposition_table = TranspositionTable(tt_megabytes, tt_replacement)
+        # The same pieces can be on the board with either player to move since discs can miss the board
+        self.side_key = get_zobrist_keys(self.rows, self.cols)[1]
+
+        # Tries the moves most likely to cause a cutoff first
+        self.move_orderer = MoveOrderer(self.point_board)
+
+        # Score for a won or lost position
+        self.WIN_SCORE = 1000000
+
+        # search statistics and budget tracking
+        self.nodes = 0
+        self.completed_depth = 0
+        self.search_time = 0
+        self.deadline = None
+        self.stopped = False
+        # Set from another thread when the result of a search is no longer wanted
+        self.cancelled = False
+        self.search_id = None
+        # running totals over every move chosen, for measuring the cpu across whole games
+        self.moves_chosen = 0
+        self.total_think_time = 0
+        self.total_nodes = 0
+
+    def get_board_tables(self):
+        key = (self.rows, self.cols, self.connect_amount)
+        if key not in board_tables:
+            board_tables[key] = self.build_board_tables()
+        return board_tables[key]
+
+    def build_board_tables(self):
+        point_board = self.score_point_board()
+        window_index = self.get_window_index()
+
+        empty_position = BitBoard(self.rows, self.cols, self.connect_amount)
+        bit_count = self.cols * empty_position.col_height
+        bit_points = np.zeros(bit_count, dtype=np.int64)
+        for i in range(self.rows):
+            for j in range(self.cols):
+                bit_points[empty_position.cell_index(i, j)] = point_board[i, j]
+
+        segment_scores = np.array([[self.score_segment(n, m) for m in range(self.connect_amount+1)] for n in range(self.connect_amount+1)], dtype=np.int64)
+
+        # floats let numpy hand the multiplication to BLAS, the counts are small enough to stay exact
+        window_matrix = np.zeros((len(window_index), bit_count), dtype=np.float64)
+        window_matrix[np.arange(len(window_index))[:, None], window_index] = 1
+
+        cell_windows = [[] for _ in range(bit_count)]
+        for window, cells in enumerate(window_index.tolist()):
+            for index in cells:
+                cell_windows[index].append(window)
+
+        for array in (point_board, window_index, bit_points, segment_scores, window_matrix):
+            array.flags.writeable = False
+
+        return {
+            'point_board' : point_board,
+            'window_index' : window_index,
+            'bit_count' : bit_count,
+            'bit_points' : bit_points,
+            'segment_scores' : segment_scores,
+            'segment_table' : segment_scores.ravel(),
+            'window_matrix' : window_matrix,
+            'cell_windows' : tuple(tuple(windows) for windows in cell_windows),
+            # plain lists for the incremental evaluation, indexing them is quicker than indexing numpy arrays
+            'segment_list' : segment_scores.ravel().tolist(),
+            'bit_point_list' : bit_points.tolist()
+        }
+
+    # Scores individual column and row pairings for the minmax algoirthm
+    def score_point_board(self):
+        # Score each position on the board based on how many potential solutions they could fill
+        point_board = np.zeros((self.rows, self.cols), dtype=int8)
+
+        for j in range(self.cols - (self.connect_amount-1)):
+            for i in range(self.rows):
+                for x in range(self.connect_amount):
+                    point_board[i, j + x] += self.point_multiplier//2
+
+        # Check vertical lines
+        for j in range(self.cols):
+            for i in range(self.rows - (self.connect_amount-1)):
+                for x in range(self.connect_amount):
+                    point_board[i + x, j] += self.point_multiplier//2
+
+        # Check diagonal lines
+        for j in range(self.cols - (self.connect_amount-1)):
+            for i in range(self.rows - (self.connect_amount-1)):
+                for x in range(self.connect_amount):
+                    point_board[i + x, j + x] += self.point_multiplier//2
+                for x in range(self.connect_amount):
+                    point_board[i + (self.connect_amount-1) - x, j + x] += self.point_multiplier//2
+
+        return point_board
+
+    # Finds the cells of every horizontal, vertical and diagonal line on the board
+    def get_window_index(self):
+        position = BitBoard(self.rows, self.cols, self.connect_amount)
+        windows = []
+
+        # Horizontal lines
+        for j in range(self.cols - (self.connect_amount-1)):
+            for i in range(self.rows):
+                windows.append([position.cell_index(i, j + x) for x in range(self.connect_amount)])
+
+        # Vertical lines
+        for j in range(self.cols):
+            for i in range(self.rows - (self.connect_amount-1)):
+                windows.append([position.cell_index(i + x, j) for x in range(self.connect_amount)])
+
+        # Diagonal lines
+        for j in range(self.cols - (self.connect_amount-1)):
+            for i in range(self.rows - (self.connect_amount-1)):
+                windows.append([position.cell_index(i + x, j + x) for x in range(self.connect_amount)])
+                windows.append([position.cell_index(i + (self.connect_amount-1) - x, j + x) for x in range(self.connect_amount)])
+
+        return np.array(windows, dtype=np.intp).reshape(-1, self.connect_amount)
+
+    # Unpacks both players' masks into arrays of 0s and 1s in bitboard order, the given piece first
+    def get_occupancy(self, position, piece):
+        opponent_piece = self.PLAYER_PIECE if piece == self.CPU_PIECE else self.CPU_PIECE
+        # every supported board fits into 64 bits
+        packed = position.masks[piece].to_bytes(8, 'little') + position.masks[opponent_piece].to_bytes(8, 'little')
+        bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), bitorder='little')
+        return bits[:self.bit_count], bits[64:64 + self.bit_count]
+
+    # Scores entire board from the perspective of a certain player for the minmax algoirthm
+    def score_position(self, position, piece):
+        pieces, opponent_pieces = self.get_occupancy(position, piece)
+
+        # Add score depending on where inside the board the pieces are
+        score = int(np.dot(self.bit_points, pieces))
+
+        # Counts both players' pieces in every line in one pass, then looks up each line's score
+        window_codes = (self.window_matrix @ (pieces * (self.connect_amount+1) + opponent_pieces)).astype(np.intp)
+        score += int(self.segment_table.take(window_codes).sum())
+
+        return score
+
+    # scores a segement of length 4 for the minmax algoirthm from how many of each piece it holds
+    def score_segment(self, piece_count, opponent_count):
+        empty_count = self.connect_amount - piece_count - opponent_count
+        score = 0
+
+        for n in range(2, self.connect_amount+1):
+            if piece_count == n and empty_count == self.connect_amount - n:
+                score += (n**3) * self.point_multiplier
+
+        if opponent_count == self.connect_amount-1 and empty_count == 1:
+            score -= ((self.connect_amount-1)**3) * (self.point_multiplier)
+
+        return score
+
+    # Picks all columns not full
+    def get_valid_cols(self, position):
+        return position.valid_cols()
+
+    # A win can only come from the most recent move, so only its lines are checked when it is known
+    def detect_win(self, position, piece_value):
+        if position.last_bit:
+            return position.last_piece == piece_value and position.wins_through(position.last_bit, piece_value)
+        return position.is_win(piece_value)
+
+    # Checks if the minmax algorithm has reached the end of a game for a certain node
+    def is_temrinal_node(self, position):
+        return self.detect_win(position, self.PLAYER_PIECE) or self.detect_win(position, self.CPU_PIECE) or position.is_full()
+
+    # Stops the search once it has used up its time or node budget
+    def out_of_budget(self):
+        if self.node_limit and self.nodes >= self.node_limit:
+            return True
+        # checking the clock every node would slow the search down
+        if self.deadline and self.nodes % 256 == 0 and time.perf_counter() > self.deadline:
+            return True
+        return False
+
+    def minimax(self, position, depth, alpha, beta, maximising_player):
+        self.nodes += 1
+        # An unfinished iteration is thrown away, so the value returned doesn't matter
+        if self.stopped or self.cancelled or (self.completed_depth and self.out_of_budget()):
+            self.stopped = True
+            return (None, 0)
+
+        # Reuses the result of an earlier search of this position if it went deep enough
+        key = position.hash ^ self.side_key if maximising_player else position.hash
+        entry = self.transposition_table.probe(key)
+        tt_move = None
+        if entry:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                flag, value = entry[2], entry[3]
+                if flag == TranspositionTable.EXACT:
+                    return tt_move, value
+                elif flag == TranspositionTable.LOWER_BOUND:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return tt_move, value
+        original_alpha, original_beta = alpha, beta
+
+        if self.detect_win(position, self.CPU_PIECE):
+            return (None, self.WIN_SCORE)
+        if self.detect_win(position, self.PLAYER_PIECE):
+            return (None, -self.WIN_SCORE)
+        if position.is_full(): # Game ended in a tie
+            return (None, 0)
+        if depth == 0:
+            if position.evaluation:
+                return (None, position.evaluation.score)
+            return (None, self.score_position(position, self.CPU_PIECE))
+
+        # The best move found last time goes first, then killer moves, history and finally the centre columns
+        ply = position.moves_played
+        piece = self.CPU_PIECE if maximising_player else self.PLAYER_PIECE
+        move_count = self.move_orderer.fill_moves(position, ply, piece, tt_move)
+        moves = self.move_orderer.move_buffers[ply]
+
+        if maximising_player:
+            value = -math.inf
+            column = moves[0]
+            for k in range(move_count):
+                col = moves[k]
+                position.play(col, self.CPU_PIECE)
+                new_score = self.minimax(position, depth-1, alpha, beta, False)[1]
+                position.undo()
+                if self.stopped:
+                    return (None, 0)
+                if new_score > value:
+                    value = new_score
+                    column = col
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    self.move_orderer.record_cutoff(col, ply, piece, depth)
+                    break
+
+        else: # Minimising player
+            value = math.inf
+            column = moves[0]
+            for k in range(move_count):
+                col = moves[k]
+                position.play(col, self.PLAYER_PIECE)
+                new_score = self.minimax(position, depth-1, alpha, beta, True)[1]
+                position.undo()
+                if self.stopped:
+                    return (None, 0)
+                if new_score < value:
+                    value = new_score
+                    column = col
+                beta = min(beta, value)
+                if alpha >= beta:
+                    self.move_orderer.record_cutoff(col, ply, piece, depth)
+                    break
+
+        if value <= original_alpha:
+            flag = TranspositionTable.UPPER_BOUND
+        elif value >= original_beta:
+            flag = TranspositionTable.LOWER_BOUND
+        else:
+            flag = TranspositionTable.EXACT
+        self.transposition_table.store(key, depth, flag, value, column)
+
+        return column, value
+
+    # Searches one move deeper at a time until the depth or budget runs out
+    # Each iteration's scores decide the order the root moves are searched in the next one
+    def iterative_deepening(self, position):
+        start_time = time.perf_counter()
+        self.transposition_table.new_search()
+        self.move_orderer.new_search()
+        # lets the worker processes tell when a new search has started
+        self.search_id = next(search_ids)
+        self.nodes = 0
+        self.completed_depth = 0
+        self.stopped = False
+        self.deadline = start_time + self.time_limit if self.time_limit else None
+        # Leaves read their score from here instead of scoring the whole board
+        position.evaluation = IncrementalEvaluation(self, position, self.CPU_PIECE)
+
+        root_cols = self.move_orderer.order_moves(self.get_valid_cols(position), position.moves_played, self.CPU_PIECE)
+        best_col = root_cols[0]
+        max_depth = min(self.depth, self.rows * self.cols - position.moves_played)
+
+        for depth in range(1, max_depth + 1):
+            scores = None
+            if self.workers > 1:
+                try:
+                    scores = self.parallel_search_root(position, root_cols, depth)
+                except concurrent.futures.process.BrokenProcessPool:
+                    # carries on in this process if the workers can't run
+                    search_pools.pop(self.workers, None)
+                    self.workers = 1
+            if scores is None:
+                scores = self.search_root(position, root_cols, depth)
+            if self.stopped:
+                break
+
+            # first column with the highest score, the same one a sequential alpha-beta search would pick
+            iteration_col = root_cols[0]
+            for col in root_cols:
+                if scores[col] > scores[iteration_col]:
+                    iteration_col = col
+
+            best_col = iteration_col
+            self.completed_depth = depth
+            # sorting is stable, so equal scores keep the previous iteration's order
+            root_cols.sort(key=lambda col: scores[col], reverse=True)
+
+            # No point looking deeper once the result of the game is known
+            if abs(scores[best_col]) >= self.WIN_SCORE:
+                break
+
+        self.search_time = time.perf_counter() - start_time
+        return best_col
+
+    # Scores every root move at a certain depth, moves that can't beat an earlier one only get an upper bound
+    def search_root(self, position, root_cols, depth):
+        alpha = -math.inf
+        scores = {}
+        for col in root_cols:
+            position.play(col, self.CPU_PIECE)
+            scores[col] = self.minimax(position, depth-1, alpha, math.inf, False)[1]
+            position.undo()
+            if self.stopped:
+                break
+            alpha = max(alpha, scores[col])
+        return scores
+
+    # Same as search_root but the root moves are shared out between worker processes
+    # The first move is searched on its own so the others can be pruned against its score
+    def parallel_search_root(self, position, root_cols, depth):
+        pool = get_search_pool(self.workers)
+        # workers get the deadline as a wall clock time, so any time spent starting them up still counts
+        end_time = time.time() + (self.deadline - time.perf_counter()) if self.deadline else None
+        # the position is sent as its two masks rather than a pickled matrix or bitboard
+        args = (self.rows, self.cols, self.connect_amount, self.CPU_PIECE, position.masks[1], position.masks[2])
+
+        first_result = self.wait_for_results([pool.submit(search_root_move, *args, root_cols[0], depth, -math.inf, end_time, self.completed_depth, self.search_id)])
+        if not first_result or first_result[0][1]:
+            self.stopped = True
+            return {}
+        results = first_result
+
+        if len(root_cols) > 1:
+            alpha = first_result[0][0]
+            other_results = self.wait_for_results([pool.submit(search_root_move, *args, col, depth, alpha, end_time, self.completed_depth, self.search_id) for col in root_cols[1:]])
+            if not other_results:
+                self.stopped = True
+                return {}
+            results += other_results
+
+        self.nodes += sum(nodes for _, _, nodes in results)
+        if any(stopped for _, stopped, _ in results):
+            self.stopped = True
+            return {}
+        return {col : value for col, (value, _, _) in zip(root_cols, results)}
+
+    # Waits for every worker to finish unless the search gets cancelled
+    def wait_for_results(self, futures):
+        while not self.cancelled:
+            _, pending = concurrent.futures.wait(futures, timeout=0.05)
+            if not pending:
+                return [future.result() for future in futures]
+        return None
+
+    # Whether the solver is worth trying on the position, there's none for the difficulties below perfect
+    def within_solver_reach(self, position):
+        return self.solver is not None and self.rows*self.cols - position.moves_played <= self.solver_max_empty_cells
+
+    # Column that is best with perfect play, or None when there's no solver or it runs out of budget
+    def solve_position(self, position):
+        if self.solver is None:
+            return None
+        result = self.solver.best_move(position, self.CPU_PIECE, self.solver_node_limit, self.solver_time_limit, lambda: self.cancelled)
+        return result[0] if result else None
+
+    # Picks the column to play, easy and medium sometimes pick one at random instead of searching
+    def choose_col(self, position):
+        start_time = time.perf_counter()
+        nodes = 0
+        pick_randomly = random.random()
+
+        if self.difficulty in ('extreme', 'perfect') or pick_randomly < 0.75:
+            col = None
+            if self.difficulty in ('extreme', 'perfect'):
+                col = self.opening_book.lookup(position, self.CPU_PIECE)
+            if col is None and self.within_solver_reach(position):
+                col = self.solve_position(position)
+                nodes += self.solver.nodes
+            if col is None:
+                col = self.iterative_deepening(position)
+                nodes += self.nodes
+        else:
+            col = random.randrange(self.cols)
+
+        self.moves_chosen += 1
+        self.total_think_time += time.perf_counter() - start_time
+        self.total_nodes += nodes
+        return col
+
+
+# Board tables for every (rows, cols, connect_amount) an engine has been made for
+board_tables = {}
+
+
+# Pools are started the first time a parallel search needs one and then kept for the rest of the game
+search_pools = {}
+
+def get_search_pool(workers):
+    if workers not in search_pools:
+        # spawned rather than forked, forking a process that is running pygame and other threads isn't safe
+        search_pools[workers] = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return search_pools[workers]
+
+
+# Starts every process of a pool and has each build its engine, without waiting for them
+def start_search_workers(workers, rows, cols, connect_amount, piece_value):
+    pool = get_search_pool(workers)
+    for _ in range(workers):
+        pool.submit(get_worker_engine, rows, cols, connect_amount, piece_value)
+
+
+# Numbers every search, unique for as long as the game is open so workers never mistake one engine's search for another's
+search_ids = itertools.count(1)
+
+
+# Engines kept alive in each worker process so their transposition tables last between searches
+worker_engines = {}
+
+def get_worker_engine(rows, cols, connect_amount, piece_value):
+    key = (rows, cols, connect_amount, piece_value)
+    if key not in worker_engines:
+        worker_engines[key] = Engine(rows, cols, connect_amount, piece_value, 'extreme', workers=1)
+        worker_engines[key].search_id = None
+    return worker_engines[key]
+
+# Runs inside a worker process and searches a single root move, returns (score, whether it ran out of time, nodes)
+def search_root_move(rows, cols, connect_amount, piece_value, red_mask, yellow_mask, col, depth, alpha, end_time, completed_depth, search_id):
+    engine = get_worker_engine(rows, cols, connect_amount, piece_value)
+    # the first root move of a new search ages the table and clears the killers, the same as iterative_deepening does
+    if engine.search_id != search_id:
+        engine.search_id = search_id
+        engine.transposition_table.new_search()
+        engine.move_orderer.new_search()
+
+    engine.nodes = 0
+    engine.stopped = False
+    # stopping early is only allowed once the main process has a finished iteration to fall back on
+    engine.completed_depth = completed_depth
+    engine.deadline = time.perf_counter() + (end_time - time.time()) if end_time else None
+
+    position = BitBoard.from_masks(rows, cols, connect_amount, red_mask, yellow_mask)
+    position.evaluation = IncrementalEvaluation(engine, position, piece_value)
+    position.play(col, piece_value)
+    value = engine.minimax(position, depth-1, alpha, math.inf, False)[1]
+    return value, engine.stopped, engine.nodes
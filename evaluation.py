@@ -0,0 +1,42 @@
+# Keeps the score of a bitboard up to date as pieces are played and undone, so the search never scores a whole board
+# Matches Engine.score_position for the piece it was made for
+class IncrementalEvaluation:
+    def __init__(self, engine, position, piece):
+        self.piece = piece
+        self.code_step = engine.connect_amount + 1
+
+        # Windows going through each bit, the window scores by count code and the point board in bitboard order
+        self.cell_windows = engine.cell_windows
+        self.segment_table = engine.segment_list
+        self.bit_points = engine.bit_point_list
+
+        # Each window's (number of pieces * (connect_amount+1) + number of opponent pieces)
+        pieces, opponent_pieces = engine.get_occupancy(position, piece)
+        self.window_codes = (engine.window_matrix @ (pieces * self.code_step + opponent_pieces)).astype(int).tolist()
+        self.score = engine.score_position(position, piece)
+
+    def add(self, index, piece):
+        step = self.code_step if piece == self.piece else 1
+        codes = self.window_codes
+        table = self.segment_table
+        score = self.score
+        for window in self.cell_windows[index]:
+            code = codes[window]
+            score += table[code + step] - table[code]
+            codes[window] = code + step
+        if piece == self.piece:
+            score += self.bit_points[index]
+        self.score = score
+
+    def remove(self, index, piece):
+        step = self.code_step if piece == self.piece else 1
+        codes = self.window_codes
+        table = self.segment_table
+        score = self.score
+        for window in self.cell_windows[index]:
+            code = codes[window]
+            score += table[code - step] - table[code]
+            codes[window] = code - step
+        if piece == self.piece:
+            score -= self.bit_points[index]
+        self.score = score
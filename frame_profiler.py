@@ -0,0 +1,143 @@
+import math
+import time
+import json
+import atexit
+from collections import deque
+import pygame
+from text_cache import get_font
+
+
+# Percentile by nearest rank, values must already be sorted
+def get_percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0
+    return sorted_values[max(0, math.ceil(percent/100 * len(sorted_values)) - 1)]
+
+
+# Times each phase of every frame of the game loop, the game only makes one when profiling is turned on
+# The loop calls begin_frame at the top of each frame and mark after each phase, a phase's time is the time since the last mark
+class FrameProfiler:
+    # Phases in the order the game loop runs them, tick is the time spent waiting for the frame rate cap
+    PHASES = ('tick', 'draw', 'events', 'input', 'cpu', 'physics', 'settle', 'buttons')
+    # Thread ids used in the trace
+    LOOP_THREAD = 1
+    CPU_THREAD = 2
+
+    def __init__(self, fps, window=300, trace_path=None, max_trace_events=500000):
+        # longest a frame's work can take without missing the frame rate, not counting the wait for the cap
+        self.frame_budget = 1 / fps
+        self.fps = fps
+
+        # seconds taken by each phase over the last window frames, phases that didn't run count as 0
+        self.phase_times = {phase : deque(maxlen=window) for phase in self.PHASES}
+        # seconds of work in each of the last window frames
+        self.frame_times = deque(maxlen=window)
+        self.frames = 0
+        self.missed_deadlines = 0
+
+        self.frame_start = None
+        self.last_mark = None
+        self.current_phases = {}
+
+        # (name, thread id, start, duration) of every span, the oldest are dropped once there are max_trace_events
+        self.trace_path = trace_path
+        self.trace_events = deque(maxlen=max_trace_events)
+        self.start_time = time.perf_counter()
+        if self.trace_path:
+            atexit.register(self.export_trace)
+
+        self.show_overlay = True
+        self.overlay_font = None
+        # rendered lines of the overlay, only redrawn every overlay_interval frames
+        self.overlay_surfaces = []
+        self.overlay_interval = 15
+
+    def begin_frame(self):
+        if self.frame_start is not None:
+            self.end_frame()
+        self.frame_start = self.last_mark = time.perf_counter()
+        self.current_phases = {}
+
+    def mark(self, phase):
+        # a reset in the middle of a frame runs a game loop of its own, which ends this frame early
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        duration = now - self.last_mark
+        self.current_phases[phase] = self.current_phases.get(phase, 0) + duration
+        if self.trace_path:
+            self.trace_events.append((phase, self.LOOP_THREAD, self.last_mark, duration))
+        self.last_mark = now
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        work_time = self.last_mark - self.frame_start - self.current_phases.get('tick', 0)
+        for phase in self.PHASES:
+            self.phase_times[phase].append(self.current_phases.get(phase, 0))
+        self.frame_times.append(work_time)
+        self.frames += 1
+        if work_time > self.frame_budget:
+            self.missed_deadlines += 1
+        if self.trace_path:
+            self.trace_events.append(('frame', self.LOOP_THREAD, self.frame_start, self.last_mark - self.frame_start))
+        self.frame_start = None
+
+    # Spans from outside the game loop, like the cpu's search thread
+    def record_span(self, name, start, end, thread=CPU_THREAD):
+        if self.trace_path:
+            self.trace_events.append((name, thread, start, end - start))
+
+    # p50, p95 and p99 in seconds of each phase and of the whole frame's work
+    def get_summary(self):
+        summary = {}
+        for name, times in list(self.phase_times.items()) + [('frame', self.frame_times)]:
+            sorted_times = sorted(times)
+            summary[name] = {f"p{percent}" : get_percentile(sorted_times, percent) for percent in (50, 95, 99)}
+        summary['frames'] = self.frames
+        summary['missed_deadlines'] = self.missed_deadlines
+        return summary
+
+    def draw_overlay(self, window):
+        if self.overlay_font is None:
+            self.overlay_font = get_font('couriernew', 14)
+
+        if self.frames % self.overlay_interval == 0 or not self.overlay_surfaces:
+            summary = self.get_summary()
+            lines = [f"{'ms':<8} {'p50':>6} {'p95':>6} {'p99':>6}"]
+            for name in self.PHASES + ('frame',):
+                times = summary[name]
+                lines.append(f"{name:<8} {1000*times['p50']:>6.2f} {1000*times['p95']:>6.2f} {1000*times['p99']:>6.2f}")
+            lines.append(f"missed {self.missed_deadlines} of {self.frames} at {self.fps} fps")
+            self.overlay_surfaces = [self.overlay_font.render(line, True, (255, 255, 255)) for line in lines]
+
+        line_height = self.overlay_font.get_linesize()
+        width = max(surface.get_width() for surface in self.overlay_surfaces) + 10
+        background = pygame.Surface((width, line_height * len(self.overlay_surfaces) + 10), pygame.SRCALPHA)
+        background.fill((0, 0, 0, 160))
+        for i, surface in enumerate(self.overlay_surfaces):
+            background.blit(surface, (5, 5 + i*line_height))
+        # the area drawn over, so it can be redrawn underneath next frame
+        return window.blit(background, (0, 0))
+
+    # Writes the spans in Chrome's trace event format, which chrome://tracing and Perfetto can open
+    def export_trace(self):
+        events = [
+            {'name' : 'thread_name', 'ph' : 'M', 'pid' : 1, 'tid' : self.LOOP_THREAD, 'args' : {'name' : 'game loop'}},
+            {'name' : 'thread_name', 'ph' : 'M', 'pid' : 1, 'tid' : self.CPU_THREAD, 'args' : {'name' : 'cpu'}}
+        ]
+        for name, thread, start, duration in list(self.trace_events):
+            events.append({
+                'name' : name,
+                'ph' : 'X',
+                'pid' : 1,
+                'tid' : thread,
+                'ts' : (start - self.start_time) * 1e6,
+                'dur' : duration * 1e6
+            })
+        try:
+            with open(self.trace_path, 'w') as file:
+                json.dump({'traceEvents' : events, 'displayTimeUnit' : 'ms', 'otherData' : self.get_summary()}, file)
+        # losing the trace shouldn't stop the game from closing
+        except OSError:
+            pass
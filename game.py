@@ -1,7 +1,6 @@
 import pygame
 import pymunk
 import time
-import os
 import numpy as np
 from numpy import int8
 import random
@@ -9,18 +8,31 @@ import math
 from menu import *
 # from trajectory import PathPredictor
 from cpu import CPU
+from frame_profiler import FrameProfiler
+from text_cache import get_font, render_text
+from assets import get_image
 
 class Catapult_4:
-    def __init__(self, width, height):
+    # A headless game has no window, no frame rate cap and draws nothing, it's played through play_headless_game
+    # input_source is called with the game whenever a non-cpu disc is ready to be aimed,
+    # it returns the point to pull the aim line back to (like the cpu's moves) or None to keep waiting
+    # profile times every phase of each frame, shown in an overlay toggled with F3, trace_path also saves them when the game closes
+    def __init__(self, width, height, headless=False, input_source=None, profile=False, trace_path=None):
         # pygame set up
         pygame.init()
         self.clock = pygame.time.Clock()
         self.WINDOW_WIDTH, self.WINDOW_HEIGHT = width, height
-        self.WINDOW = pygame.display.set_mode((self.WINDOW_WIDTH, self.WINDOW_HEIGHT))
-        pygame.display.set_caption("Catapult Connect 4")
+        self.headless = headless
+        self.input_source = input_source
+        if self.headless:
+            # still gives sprites and menus something to draw onto
+            self.WINDOW = pygame.Surface((self.WINDOW_WIDTH, self.WINDOW_HEIGHT))
+        else:
+            self.WINDOW = pygame.display.set_mode((self.WINDOW_WIDTH, self.WINDOW_HEIGHT))
+            pygame.display.set_caption("Catapult Connect 4")
 
         # set up fonts
-        self.aim_font = pygame.font.SysFont("verdana", 20)
+        self.aim_font = get_font("verdana", 20)
         self.win_font_name = 'hpsimplified'
         self.win_font_size = self.WINDOW_HEIGHT//8   
         self.turn_font_size = self.win_font_size//3    
@@ -41,6 +53,9 @@ class Catapult_4:
         self.FPS = 120
         self.STEP_SIZE = 1/50
 
+        # Left as None unless profiling, so the game loop only pays for a check on each phase
+        self.profiler = FrameProfiler(self.FPS, trace_path=trace_path) if profile or trace_path else None
+
         # game colours
         self.BLUE = (40, 90, 210)
         self.RED = (255, 0, 0)
@@ -85,6 +100,17 @@ class Catapult_4:
         self.aim_line_group = pygame.sprite.Group()
         self.disc_group = pygame.sprite.Group()
         self.button_group = pygame.sprite.Group()
+
+        # The game loop only redraws what has moved, moving discs go behind the board and the buttons in front of it
+        self.DISC_LAYER = 0
+        self.BOARD_LAYER = 1
+        self.BUTTON_LAYER = 2
+        self.render_group = pygame.sprite.LayeredDirty()
+        # the frame and background colour, drawn once a game
+        self.background = None
+        # areas the aim line and the text were drawn over last frame, they aren't sprites
+        self.overlay_rects = []
+        self.full_redraw = True
         
         self.buttons = []
         self.button_size = min(self.WINDOW_WIDTH, self.WINDOW_HEIGHT)//10
@@ -100,9 +126,18 @@ class Catapult_4:
         self.game_mode = self.game_modes['standard']
 
         self.cpu_difficulty = 'medium'
+        # processes the cpu's search may use, None leaves it to the difficulty
+        self.cpu_workers = None
 
         self.disc = None
         self.board = None       
+        self.cpu = None
+
+        # Outcome of a headless game: the winning piece value, 0 for a draw or None while it's unfinished
+        self.result = None
+        # physics steps taken in the current headless game and the most it may take
+        self.steps = 0
+        self.max_steps = None
 
         self.main_menu = MainMenu(self)
         self.game_mode_menu = GameModeMenu(self)
@@ -126,6 +161,8 @@ class Catapult_4:
             self.WINDOW = window
             # maximun line length
             self.max_dis = max_dis
+            # area of the window the line and its label were last drawn over
+            self.drawn_rect = None
 
         def update(self):
             # Creates line between first clicked position and current position
@@ -136,11 +173,11 @@ class Catapult_4:
             angle = math.atan2(y_dif , x_dif)
 
             if distance < self.max_dis:
-                pygame.draw.line(self.WINDOW, self.colour, self.origin, self.endpoint, self.line_width)
+                line_rect = pygame.draw.line(self.WINDOW, self.colour, self.origin, self.endpoint, self.line_width)
 
                 power_ind = round(distance / (self.max_dis/100), 1)
-                label = self.aim_font.render(f"{power_ind}", 1, self.colour)
-                self.WINDOW.blit(label, (self.endpoint[0] + 10, self.endpoint[1] + 10))
+                label = render_text(self.aim_font, f"{power_ind}", self.colour)
+                label_rect = self.WINDOW.blit(label, (self.endpoint[0] + 10, self.endpoint[1] + 10))
 
             else: # if cursor is further than the max line distance, it gets the angle and draws the line at the set max length
                 new_x_dif = math.floor(self.max_dis * math.cos(angle))
@@ -149,29 +186,43 @@ class Catapult_4:
 
                 power_ind = 100
         
-                pygame.draw.line(self.WINDOW, self.colour, self.origin, self.endpoint, self.line_width)
-                label = self.aim_font.render(f"{power_ind}", 1, self.colour)
-                self.WINDOW.blit(label, (self.endpoint[0] + 10, self.endpoint[1] + 10))
+                line_rect = pygame.draw.line(self.WINDOW, self.colour, self.origin, self.endpoint, self.line_width)
+                label = render_text(self.aim_font, f"{power_ind}", self.colour)
+                label_rect = self.WINDOW.blit(label, (self.endpoint[0] + 10, self.endpoint[1] + 10))
 
+            self.drawn_rect = line_rect.union(label_rect)
             self.power = power_ind
             self.angle = angle
 
+        # Aims at a point without the mouse, the power is rounded the same way as when dragging
+        def aim_at(self, target_endpoint):
+            x_dif = target_endpoint[0] - self.origin[0]
+            y_dif = target_endpoint[1] - self.origin[1]
+            distance = math.sqrt(x_dif**2 + y_dif**2)
+
+            self.power = round(distance / (self.max_dis/100), 1)
+            self.angle = math.atan2(y_dif, x_dif)
+
+
+    class Disc(pygame.sprite.DirtySprite):
+        # physical properties of every disc, the shot simulator copies them
+        MASS = 10
+        ELASTICITY = 0.65
+        FRICTION = 1
 
-    class Disc(pygame.sprite.Sprite):
         def __init__(self, pos, radius, image, turn, space, launch_factor):
             super().__init__()
 
             # creates disc as pymunk shape and adds to space
-            mass = 10
-            self.body = pymunk.Body(mass, pymunk.moment_for_circle(mass, 0, radius), body_type=pymunk.Body.DYNAMIC)
+            self.body = pymunk.Body(self.MASS, pymunk.moment_for_circle(self.MASS, 0, radius), body_type=pymunk.Body.DYNAMIC)
             self.body.position = pos # center of the body
             self.shape = pymunk.Circle(self.body, radius)
-            self.shape.elasticity = 0.65
-            self.shape.friction = 1
+            self.shape.elasticity = self.ELASTICITY
+            self.shape.friction = self.FRICTION
             self.space = space
             self.space.add(self.body, self.shape)
 
-            self.image = pygame.transform.scale(pygame.image.load(os.path.join('resources', image)), (2*radius, 2*radius))
+            self.image = get_image(image, (2*radius, 2*radius))
             self.rect = self.image.get_rect()
             self.rect.center = pos
 
@@ -186,7 +237,14 @@ class Catapult_4:
             self.path_prediction = None
 
         def update(self):
+            center = self.rect.center
             self.rect.center = self.body.position
+            # only redrawn once it has moved a whole pixel
+            if self.rect.center != center:
+                self.dirty = 1
+                # discs landing on top can still knock a settled disc about
+                if self.set_in_board:
+                    self.board.discs_moved = True
 
         def launch(self, angle, power):
             x_component = math.cos(angle) * power * self.launch_factor
@@ -201,12 +259,18 @@ class Catapult_4:
             for i in range(board.rows-1, -1, -1):
                 if board.filled_spaces[i, j] == 0:
                     board.filled_spaces[i, j] = self.piece_value
+                    board.last_move = (i, j)
                     break
+            # from now on it's drawn as part of the board
+            self.board = board
+            board.add_disc(self)
 
 
     class Board:
-        def __init__(self, space, colour, window, window_width, window_height, rows, cols, connect_amount):
+        def __init__(self, space, colour, window, window_width, window_height, rows, cols, connect_amount, headless=False):
             self.colour = colour
+            # a headless board is never drawn, so it has no sprite
+            self.headless = headless
             self.WINDOW = window
             self.WINDOW_HEIGHT = window_height
             self.WINDOW_WIDTH = window_width
@@ -237,6 +301,8 @@ class Catapult_4:
             self.SOL_LINE_THICKNESS = self.DISC_RADIUS//4
 
             self.filled_spaces = np.zeros((self.rows, self.cols), dtype=int8)
+            # (row, column) of the most recent disc set into the board
+            self.last_move = None
             # The origin is the vertical centre of the board (not including the base), and on the left hand side
             self.origin = (self.WINDOW_WIDTH//2 - ((self.SLOT_SIZE + self.SLOT_BORDER)*self.cols + self.SLOT_BORDER)//2, self.WINDOW_HEIGHT - self.FRAME_HEIGHT//2 - self.WINDOW_HEIGHT//15) 
             self.base_height = min(self.WINDOW_HEIGHT, self.WINDOW_WIDTH)//20
@@ -244,10 +310,21 @@ class Catapult_4:
             self.elasticity = 0.75
             # frame is a list of shapes that make up the board
             self.frame = self.make_frame(space)        
-            self.cover_image = pygame.transform.scale(pygame.image.load(os.path.join('resources', 'Board_Front.png')), (self.SLOT_SIZE, self.DISC_RADIUS*2))
+            self.cover_image = get_image('Board_Front.png', (self.SLOT_SIZE, self.DISC_RADIUS*2))
             # reference points for drawing the cover
             self.bottom_left_point = (self.frame[0].bb[2], self.frame[0].bb[3] - self.cover_image.get_height())
             self.top_left_point = (self.frame[0].bb[2], self.frame[0].bb[1])
+            # The board is drawn once into a sprite, settled discs go on a layer behind the frame and cover
+            # and the two are only put together again when a disc settles, so drawing it costs the same however full it gets
+            self.settled_discs = []
+            self.discs_moved = False
+            self.sprite = None
+            if not self.headless:
+                self.front_image, board_rect = self.make_front()
+                self.disc_layer = pygame.Surface(board_rect.size, pygame.SRCALPHA)
+                self.sprite = pygame.sprite.DirtySprite()
+                self.sprite.rect = board_rect
+                self.bake()
 
             # points in each column in which a disc would land
             self.query_points = [(self.origin[0] + ((i + 1/2) * (self.SLOT_SIZE + self.SLOT_BORDER)), self.origin[1] + self.FRAME_HEIGHT//2 - self.DISC_RADIUS) for i in range(self.cols)]
@@ -278,13 +355,15 @@ class Catapult_4:
 
             return frame
 
-        def draw_frame(self):
+        # offset is where the surface's top left corner is in the window
+        def draw_frame(self, surface=None, offset=(0, 0)):
+            surface = surface or self.WINDOW
             for poly in self.frame:
                 pos_x = int(poly.bb[0])
                 pos_y = int(poly.bb[1])
                 width = int(poly.bb[2] - poly.bb[0])
                 height = int(poly.bb[3] - poly.bb[1])
-                pygame.draw.rect(self.WINDOW, self.colour, pygame.Rect(pos_x, pos_y, width, height))     
+                pygame.draw.rect(surface, self.colour, pygame.Rect(pos_x - offset[0], pos_y - offset[1], width, height))     
 
         def update_query_points(self, i):
             # if current query_point isn't in the top row
@@ -293,28 +372,46 @@ class Catapult_4:
             else:
                 self.query_points[i] = (0,0)
 
+        # Only the lines through the last disc set into the board can have just been completed
         def detect_win(self, piece_value):
-            # Check horizontal lines
-            for j in range(self.cols - (self.CONNECT_AMOUNT-1)):
-                for i in range(self.rows):
-                    if np.all(self.filled_spaces[i, j : j+self.CONNECT_AMOUNT] == piece_value):
-                        return (self.rows - (i+1), j), self.H_SOLUTION
-
-            # Check vertical lines
-            for j in range(self.cols):
-                for i in range(self.rows - (self.CONNECT_AMOUNT-1)):
-                    if np.all(self.filled_spaces[i : i+self.CONNECT_AMOUNT, j].flatten() == piece_value):
-                        return (self.rows - (i+1), j), self.V_SOLUTION   
-
-            # Check diagonal lines
-            for j in range(self.cols - (self.CONNECT_AMOUNT-1)):
-                for i in range(self.rows - (self.CONNECT_AMOUNT-1)):
-                    if np.all(self.filled_spaces[i : i+self.CONNECT_AMOUNT, j : j+self.CONNECT_AMOUNT].diagonal() == piece_value):
-                        return (self.rows - (i+1), j), self.PD_SOLUTION   
-                    if np.all(np.rot90(self.filled_spaces[i : i+self.CONNECT_AMOUNT, j : j+self.CONNECT_AMOUNT]).diagonal() == piece_value):
-                        return (self.rows - (i+1), j), self.SD_SOLUTION        
-
-            return None, None   
+            if self.last_move is None:
+                return None, None
+            row, col = self.last_move
+            # a disc that missed the board leaves last_move on the disc before it, which may not be piece_value's
+            if self.filled_spaces[row, col] != piece_value:
+                return None, None
+
+            # (row step, column step) along each line, stepping forwards always moves right or down a vertical line
+            line_steps = [(self.H_SOLUTION, 0, 1), (self.V_SOLUTION, 1, 0), (self.PD_SOLUTION, 1, 1), (self.SD_SOLUTION, -1, 1)]
+            # winning diagonals as ((column, top row, pd before sd), result), one disc can finish both
+            diagonal_wins = []
+            for direction, di, dj in line_steps:
+                # counts matching discs behind and in front of the last move
+                behind = 0
+                while self.in_board(row - (behind+1)*di, col - (behind+1)*dj) and self.filled_spaces[row - (behind+1)*di, col - (behind+1)*dj] == piece_value:
+                    behind += 1
+                ahead = 0
+                while self.in_board(row + (ahead+1)*di, col + (ahead+1)*dj) and self.filled_spaces[row + (ahead+1)*di, col + (ahead+1)*dj] == piece_value:
+                    ahead += 1
+
+                if behind + ahead + 1 >= self.CONNECT_AMOUNT:
+                    # Uses the first winning section from the left (or top) to match the order of a full board scan
+                    start = max(-behind, 1 - self.CONNECT_AMOUNT)
+                    start_i, start_j = row + start*di, col + start*dj
+                    top_i = min(start_i, start_i + (self.CONNECT_AMOUNT-1)*di)
+                    result = (self.rows - (top_i+1), start_j), direction
+                    # a full scan checks every horizontal line, then every vertical one, before any diagonal
+                    if direction in (self.H_SOLUTION, self.V_SOLUTION):
+                        return result
+                    # then goes through the diagonals column by column and row by row from the top, pd before sd
+                    diagonal_wins.append(((start_j, top_i, direction == self.SD_SOLUTION), result))
+
+            if diagonal_wins:
+                return min(diagonal_wins)[1]
+            return None, None
+
+        def in_board(self, i, j):
+            return 0 <= i < self.rows and 0 <= j < self.cols
 
         def detect_tie(self):
             if not np.any(self.filled_spaces == self.EMPTY):
@@ -325,24 +422,58 @@ class Catapult_4:
             for point in self.query_points:
                 pygame.draw.circle(self.WINDOW, colour, (point[0], point[1]), 10)
 
-        def draw_cover(self):
+        def draw_cover(self, surface=None, offset=(0, 0)):
+            surface = surface or self.WINDOW
             for i in range(self.rows):
                 for j in range(self.cols):
-                    self.WINDOW.blit(self.cover_image, (self.bottom_left_point[0] + (j*(self.SLOT_SIZE+self.SLOT_BORDER)), self.bottom_left_point[1] - (i*self.cover_image.get_height())))
+                    surface.blit(self.cover_image, (self.bottom_left_point[0] + (j*(self.SLOT_SIZE+self.SLOT_BORDER)) - offset[0], self.bottom_left_point[1] - (i*self.cover_image.get_height()) - offset[1]))
             vertical_midpoint = (self.top_left_point[1] + (self.bottom_left_point[1] - (self.cover_image.get_height() * (self.rows-1)))) // 2
-            pygame.draw.rect(self.WINDOW, self.colour, pygame.Rect(self.origin[0], vertical_midpoint, self.FRAME_WIDTH - self.SLOT_BORDER, vertical_midpoint - self.top_left_point[1])) 
-
-
-    class Button(pygame.sprite.Sprite):
+            pygame.draw.rect(surface, self.colour, pygame.Rect(self.origin[0] - offset[0], vertical_midpoint - offset[1], self.FRAME_WIDTH - self.SLOT_BORDER, vertical_midpoint - self.top_left_point[1])) 
+
+        # The frame with the cover over it and the area of the window they take up
+        # The base moves while the game resets, so that is drawn with draw_frame and draw_cover instead
+        def make_front(self):
+            # the cover doesn't reach past the frame, so the frame's bounding boxes hold all of it
+            board_rect = pygame.Rect(int(self.frame[0].bb[0]), int(self.frame[0].bb[1]), 0, 0)
+            board_rect = board_rect.unionall([pygame.Rect(int(poly.bb[0]), int(poly.bb[1]), int(poly.bb[2] - poly.bb[0]), int(poly.bb[3] - poly.bb[1])) for poly in self.frame])
+
+            front_image = pygame.Surface(board_rect.size, pygame.SRCALPHA)
+            self.draw_frame(front_image, board_rect.topleft)
+            self.draw_cover(front_image, board_rect.topleft)
+            return front_image, board_rect
+
+        # Puts the settled discs and the front of the board together into the sprite's image
+        def bake(self):
+            self.sprite.image = self.disc_layer.copy()
+            self.sprite.image.blit(self.front_image, (0, 0))
+            self.sprite.dirty = 1
+
+        def draw_disc(self, disc):
+            self.disc_layer.blit(disc.image, disc.rect.move(-self.sprite.rect.x, -self.sprite.rect.y))
+
+        def add_disc(self, disc):
+            self.settled_discs.append(disc)
+            if not self.headless:
+                self.draw_disc(disc)
+                self.bake()
+
+        # Draws the settled discs again if any have moved since they were drawn
+        def redraw_discs(self):
+            if self.discs_moved:
+                self.discs_moved = False
+                self.disc_layer.fill((0, 0, 0, 0))
+                for disc in self.settled_discs:
+                    self.draw_disc(disc)
+                self.bake()
+
+
+    class Button(pygame.sprite.DirtySprite):
         def __init__(self, pos, image, hover_image, width, height, function):
             super().__init__()
             self.function = function
 
-            self.image = pygame.image.load(os.path.join('resources', image))
-            self.image  = pygame.transform.scale(self.image, (width, height))
-
-            self.hover_image = pygame.image.load(os.path.join('resources', hover_image))
-            self.hover_image  = pygame.transform.scale(self.hover_image, (width, height))
+            self.image = get_image(image, (width, height))
+            self.hover_image = get_image(hover_image, (width, height))
 
             self.rect = self.image.get_rect()
             self.rect.center = pos
@@ -368,10 +499,12 @@ class Catapult_4:
                 if not self.hovering:
                     self.hovering = True
                     self.image, self.hover_image = self.hover_image, self.image
+                    self.dirty = 1
 
             elif self.hovering:
                 self.hovering = False
                 self.image, self.hover_image = self.hover_image, self.image
+                self.dirty = 1
 
 
     def check_exited(self):
@@ -385,6 +518,8 @@ class Catapult_4:
 
     # Pauses the game but still allows the use of buttons
     def wait(self, wait_time):
+        if self.headless:
+            return
         start_time = time.time()
         time_passed = 0
         while time_passed < wait_time:
@@ -406,6 +541,7 @@ class Catapult_4:
         elif self.turn == self.YELLOW_TURN:
             self.disc = self.Disc(self.YELLOW_SPAWN, self.board.DISC_RADIUS, 'Yellow_Disc.png', self.turn, self.space, self.disc_launch_factor)
         self.disc_group.add(self.disc)
+        self.render_group.add(self.disc, layer=self.DISC_LAYER)
         self.ready_to_aim = True
 
 
@@ -423,13 +559,19 @@ class Catapult_4:
                     self.reset()
                 elif button.function == 'back':
                     self.playing = False
+                    if self.cpu:
+                        self.cpu.cancel()
                 return True
         return False
 
 
     def reset(self):
+        # Any move the cpu is still working out is for the old board
+        if self.cpu:
+            self.cpu.cancel()
+
         # Move final frame piece to the left so the pieces all fall out of the frame before resetting
-        if self.playing:
+        if self.playing and not self.headless:
             self.resetting = True
             start_time = time.time()
             time_passed = 0
@@ -471,8 +613,15 @@ class Catapult_4:
 
         self.disc_group = pygame.sprite.Group()
 
-        self.board = self.Board(self.space, self.BLUE, self.WINDOW, self.WINDOW_WIDTH, self.WINDOW_HEIGHT, self.game_mode[0], self.game_mode[1], self.game_mode[2])
+        self.board = self.Board(self.space, self.BLUE, self.WINDOW, self.WINDOW_WIDTH, self.WINDOW_HEIGHT, self.game_mode[0], self.game_mode[1], self.game_mode[2], self.headless)
 
+        self.render_group = pygame.sprite.LayeredDirty()
+        if not self.headless:
+            self.render_group.add(self.board.sprite, layer=self.BOARD_LAYER)
+        self.render_group.add(*self.buttons, layer=self.BUTTON_LAYER)
+        self.full_redraw = True
+
+        self.cpu = None
         if self.vs_cpu:
             if self.game_mode == self.game_modes['precision']:
                 # Always lets player move first in precision since it is unwinnable vs an extreme cpu
@@ -481,7 +630,7 @@ class Catapult_4:
                 p = random.randrange(2)
             self.cpu_piece = [self.RED_PIECE, self.YELLOW_PIECE][p]
             self.cpu_colour = [self.RED, self.YELLOW][p]
-            self.cpu = CPU(self, self.cpu_piece, [self.RED_SPAWN, self.YELLOW_SPAWN][p], self.cpu_difficulty)
+            self.cpu = CPU(self, self.cpu_piece, [self.RED_SPAWN, self.YELLOW_SPAWN][p], self.cpu_difficulty, self.cpu_workers)
             if self.cpu_piece == self.YELLOW_PIECE:
                 self.switch_turns()
 
@@ -510,6 +659,7 @@ class Catapult_4:
 
     def remove_disc(self):
         self.disc_group.remove(self.disc)
+        self.render_group.remove(self.disc)
         self.space.remove(self.disc.shape, self.disc.body)        
 
 
@@ -529,8 +679,7 @@ class Catapult_4:
 
 
     def draw_text(self, font_name, pos, size, colour, text):
-        font = pygame.font.SysFont(font_name, size)
-        text_surface = font.render(text, True, colour)
+        text_surface = render_text(get_font(font_name, size), text, colour)
         text_rect = text_surface.get_rect()
         text_rect.center = pos
         self.WINDOW.blit(text_surface, text_rect)
@@ -562,19 +711,31 @@ class Catapult_4:
 
     # Shows whose turn it currently is
     def show_turn(self):
-        font = pygame.font.SysFont(self.win_font_name, self.turn_font_size)
-        text_surface = font.render("Computer's turn:", True, self.cpu_colour)
-        self.WINDOW.blit(text_surface, (self.WINDOW_WIDTH//50, self.WINDOW_HEIGHT//50))
+        text = "Computer's turn:"
+        if self.cpu.thinking:
+            # the dots keep moving so it's clear the game hasn't frozen
+            text = "Computer's thinking" + "." * (pygame.time.get_ticks()//400 % 4)
+        text_surface = render_text(get_font(self.win_font_name, self.turn_font_size), text, self.cpu_colour)
+        return self.WINDOW.blit(text_surface, (self.WINDOW_WIDTH//50, self.WINDOW_HEIGHT//50))
 
 
     def draw_window(self):
         self.WINDOW.fill(self.BG_COLOUR)
-        self.disc_group.draw(self.WINDOW)
-        self.board.draw_frame()
+        if self.resetting:
+            # the base is sliding away and the settled discs are falling out, so everything is drawn where it is now
+            self.disc_group.draw(self.WINDOW)
+            self.board.draw_frame()
+        else:
+            # settled discs are already part of the board's sprite
+            self.board.redraw_discs()
+            for disc in self.render_group.get_sprites_from_layer(self.DISC_LAYER):
+                self.WINDOW.blit(disc.image, disc.rect)
+            self.WINDOW.blit(self.board.sprite.image, self.board.sprite.rect)
         #self.board.draw_query_points(self.BLACK)
         self.aim_line_group.update() 
         self.button_group.draw(self.WINDOW)   
-        self.board.draw_cover()           
+        if self.resetting:
+            self.board.draw_cover()           
         # if self.disc.path_prediction:
         #     self.disc.path_prediction.draw_path(self.WINDOW, self.BLACK)
         if self.computer_turn:
@@ -582,7 +743,49 @@ class Catapult_4:
         #pygame.display.update()        
 
 
+    # Window with nothing but the background colour, the board and everything else are sprites drawn over it
+    def make_background(self):
+        background = pygame.Surface(self.WINDOW.get_size())
+        if pygame.display.get_surface() is not None:
+            background = background.convert()
+        background.fill(self.BG_COLOUR)
+        return background
+
+    # Redraws only the parts of the window that have changed since the last frame and updates just those parts of the screen
+    # Everything is redrawn after a reset, or if the window has changed size
+    def update_window(self):
+        if self.full_redraw or self.background is None or self.background.get_size() != self.WINDOW.get_size():
+            self.full_redraw = False
+            self.background = self.make_background()
+            self.render_group.clear(self.WINDOW, self.background)
+            self.render_group.repaint_rect(self.WINDOW.get_rect())
+        self.board.redraw_discs()
+
+        # Anything drawn straight onto the window last frame gets painted over with whatever is underneath
+        for rect in self.overlay_rects:
+            self.render_group.repaint_rect(rect)
+        rects = self.render_group.draw(self.WINDOW)
+
+        self.overlay_rects = []
+        self.aim_line_group.update()
+        for aim_line in self.aim_line_group:
+            if aim_line.drawn_rect:
+                self.overlay_rects.append(aim_line.drawn_rect)
+        if self.computer_turn:
+            self.overlay_rects.append(self.show_turn())
+        if self.profiler and self.profiler.show_overlay:
+            self.overlay_rects.append(self.profiler.draw_overlay(self.WINDOW))
+
+        pygame.display.update(rects + self.overlay_rects)
+
+
     def end_game(self, tie = False):
+        # A headless game just records the result and stops, whoever is running it starts the next one
+        if self.headless:
+            if self.result is None:
+                self.result = 0 if tie else self.disc.piece_value
+            self.playing = False
+            return
         self.print_result(tie)
         self.wait(self.sol_wait_time)
         self.reset()     
@@ -615,18 +818,34 @@ class Catapult_4:
             temp_disc_pos = (0, 0)
             self.prev_time = time.time()
 
+        profiler = self.profiler
         while self.playing:
-            self.clock.tick(self.FPS)
+            if profiler:
+                profiler.begin_frame()
+            if self.headless:
+                self.steps += 1
+                if self.max_steps and self.steps > self.max_steps:
+                    self.playing = False
+                    break
+            else:
+                self.clock.tick(self.FPS)
+                if profiler:
+                    profiler.mark('tick')
 
-            # self.update_delta_time()
+                # self.update_delta_time()
 
-            self.draw_window()
-            pygame.display.update()
+                self.update_window()
+                if profiler:
+                    profiler.mark('draw')
           
-            for event in pygame.event.get():
+            # a headless game has no window to send events
+            events = [] if self.headless else pygame.event.get()
+            for event in events:
                 if event.type == pygame.QUIT:
                     self.running, self.playing = False, False
                     self.current_menu.run_display = False
+                    if self.cpu:
+                        self.cpu.cancel()
 
                 # Player aim and launch disc
                 if event.type == pygame.MOUSEBUTTONDOWN and self.player_turn:
@@ -636,21 +855,48 @@ class Catapult_4:
                 if event.type == pygame.MOUSEBUTTONUP and aim_line and self.player_turn:
                     aim_line = self.release_aim_indicator(aim_line)
 
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and profiler:
+                    profiler.show_overlay = not profiler.show_overlay
+
                 # Cheat for testing
                 # if event.type == pygame.KEYDOWN:
                 #     if event.key == pygame.K_s:
                 #         self.disc.body.position = pygame.mouse.get_pos()
+            if profiler:
+                profiler.mark('events')
+
+            # Scripted shots take the place of the mouse
+            if self.input_source and not self.computer_turn and self.ready_to_aim:
+                target_endpoint = self.input_source(self)
+                if target_endpoint is not None:
+                    aim_line = self.Aim_Line(tuple(self.disc.body.position), self.BLACK, self.aim_font, self.WINDOW, self.aim_line_max_dis)
+                    aim_line.aim_at((round(target_endpoint[0]), round(target_endpoint[1])))
+                    aim_line = self.release_aim_indicator(aim_line)
+            if profiler:
+                profiler.mark('input')
 
-            # CPU aim and launch disc
+            # CPU thinks in the background, then aims and launches disc once it has a move
             if self.computer_turn and self.ready_to_aim:
-                self.cpu.aim_disc(self.Aim_Line(self.cpu.piece_spawn, self.BLACK, self.aim_font, self.WINDOW, self.aim_line_max_dis))
-                self.release_aim_indicator(self.cpu.aim_line)
+                if not self.cpu.thinking and not self.cpu.has_move():
+                    self.cpu.start_thinking()
+                    # there's nothing to draw in the meantime, so a headless game just waits for the move
+                    if self.headless:
+                        self.cpu.search_thread.join()
+                if self.cpu.has_move():
+                    move = self.cpu.take_move()
+                    self.cpu.aim_disc(self.Aim_Line(self.cpu.piece_spawn, self.BLACK, self.aim_font, self.WINDOW, self.aim_line_max_dis), move)
+                    self.release_aim_indicator(self.cpu.aim_line)
+            if profiler:
+                profiler.mark('cpu')
 
             # Suspends space if a disc has just spawned
             if not self.ready_to_aim:
                 self.space.step(self.STEP_SIZE)
 
             self.disc_group.update()
+            if profiler:
+                profiler.mark('physics')
+
             # Checks if disc has fallen off screen
             if self.disc.rect.top > self.WINDOW_HEIGHT:
                 self.remove_disc()
@@ -663,6 +909,7 @@ class Catapult_4:
                 for i, point in enumerate(self.board.query_points):
                     if self.disc.shape.point_query(point)[2] < 0:
                         self.disc.set_to_board(self.board, i)
+                        self.render_group.remove(self.disc)
                         self.board.update_query_points(i)
                         break
 
@@ -675,10 +922,12 @@ class Catapult_4:
                     if self.detect_precision_win():
                         self.end_game()
 
-                winning_cell, line_direction = self.board.detect_win(self.disc.piece_value)
-                if winning_cell:
-                    self.draw_solution_line(winning_cell, line_direction, self.ORANGE)
-                    self.end_game()
+                if self.disc.set_in_board:
+                    winning_cell, line_direction = self.board.detect_win(self.disc.piece_value)
+                    if winning_cell:
+                        if not self.headless:
+                            self.draw_solution_line(winning_cell, line_direction, self.ORANGE)
+                        self.end_game()
 
                 if self.board.detect_tie():
                     self.end_game(True)
@@ -688,12 +937,34 @@ class Catapult_4:
                 # make player turn if computer turn and vice versa if vs cpu
                 if self.vs_cpu:
                     self.switch_turns()
+            if profiler:
+                profiler.mark('settle')
 
-            self.button_group.update()
-            self.check_buttons()            
+            if not self.headless:
+                self.button_group.update()
+                self.check_buttons()            
+            if profiler:
+                profiler.mark('buttons')
 
             temp_disc_pos = self.disc.body.position      
 
+        if profiler:
+            profiler.end_frame()
+
+
+    # Plays a whole game of the current mode without a window, as fast as the physics can be stepped
+    # Returns the winning piece value, 0 for a draw or None if the game went on longer than max_steps
+    def play_headless_game(self, max_steps=None):
+        self.playing = False
+        self.reset()
+
+        self.result = None
+        self.steps = 0
+        self.max_steps = max_steps
+        self.playing = True
+        self.game_loop()
+        return self.result
+
 
 if __name__ == '__main__':
     game = Catapult_4()
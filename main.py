@@ -1,15 +1,22 @@
+import argparse
 from game import Catapult_4
 from window_sizer import StartWindow
 
-start_window = StartWindow()
-start_window.run()
+# The guard stops the cpu's search worker processes from opening their own windows when they import this file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Catapult Connect 4')
+    parser.add_argument('--profile', action='store_true', help='time each part of every frame, F3 shows or hides the timings')
+    parser.add_argument('--trace', help='also save the frame timings to this file as a Chrome trace when the game closes')
+    args = parser.parse_args()
 
-# Ensures you pressed play on the first window instead of just closing it
-if start_window.launched_game:
+    start_window = StartWindow()
+    start_window.run()
 
-    game = Catapult_4(start_window.game_width, start_window.game_height)
+    # Ensures you pressed play on the first window instead of just closing it
+    if start_window.launched_game:
 
-    while game.running:
-        game.current_menu.draw_menu()
-        game.game_loop()
+        game = Catapult_4(start_window.game_width, start_window.game_height, profile=args.profile, trace_path=args.trace)
 
+        while game.running:
+            game.current_menu.draw_menu()
+            game.game_loop()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import pygame
-import os
+from text_cache import get_font, render_text
+from assets import get_image
 
 # Parent class for all menus
 class Menu:
@@ -36,8 +37,7 @@ class Menu:
             button.clicked = True
 
     def draw_text(self, pos, size, text):
-        font = pygame.font.SysFont(self.font_name, size)
-        text_surface = font.render(text, True, self.text_colour)
+        text_surface = render_text(get_font(self.font_name, size), text, self.text_colour)
         text_rect = text_surface.get_rect()
         text_rect.center = pos
         self.DISPLAY.blit(text_surface, text_rect)
@@ -60,7 +60,7 @@ class MainMenu(Menu):
     def __init__(self, game):
         Menu.__init__(self, game)
         # Positions the title card
-        self.title_card = pygame.transform.scale(pygame.image.load(os.path.join('resources', "Title_Card.png")), (self.DISPLAY_WIDTH//2, self.DISPLAY_HEIGHT//4))
+        self.title_card = get_image("Title_Card.png", (self.DISPLAY_WIDTH//2, self.DISPLAY_HEIGHT//4))
         self.title_card_rect = self.title_card.get_rect()
         self.title_card_rect.center = (self.mid_w, self.DISPLAY_HEIGHT//4)
 
@@ -150,12 +150,13 @@ class VersusMenu(Menu):
             0 : 'Easy',
             1 : 'Medium',
             2 : 'Extreme',
+            3 : 'Perfect',
         }
         self.difficulty_index = 1
         self.difficulty = self.difficulties[self.difficulty_index]
 
         self.min_difficulty = 0
-        self.max_difficulty = 2
+        self.max_difficulty = 3
 
         # positions for each button
         self.back_pos = (self.mid_w, self.mid_h - self.button_buffer)
@@ -164,7 +165,7 @@ class VersusMenu(Menu):
         self.difficulty_pos = (self.mid_w, self.mid_h + 2*self.button_buffer)
         # Covers the difficulty of the cpu when playing multiplayer
         self.cover_rect = pygame.Rect(0, self.difficulty_pos[1] - self.button_height//2, self.DISPLAY_WIDTH, self.button_height)
-        self.plate = pygame.transform.scale(pygame.image.load(os.path.join('resources', "Plate_Wide.png")), (self.button_width, self.button_height))
+        self.plate = get_image("Plate_Wide.png", (self.button_width, self.button_height))
 
         self.add_button(self.back_pos, "Back_Button.png", "Hover_Back_Button.png", self.button_height, self.button_height, 'back')
         self.add_button(self.multiplayer_pos, "Plate_Wide.png", "Hover_Plate_Wide.png", self.button_width, self.button_height, 'multiplayer')
@@ -175,7 +176,7 @@ class VersusMenu(Menu):
         self.add_button((self.difficulty_pos[0] - self.side_button_buffer, self.difficulty_pos[1]), "Left_Button.png", "Hover_Left_Button.png", self.button_height, self.button_height, 'lower_difficulty')
         self.add_button((self.difficulty_pos[0] + self.side_button_buffer, self.difficulty_pos[1]), "Right_Button.png", "Hover_Right_Button.png", self.button_height, self.button_height, 'raise_difficulty')
 
-        self.highlight = pygame.transform.scale(pygame.image.load(os.path.join('resources', "Confirm_Button.png")), (self.button_height, self.button_height))
+        self.highlight = get_image("Confirm_Button.png", (self.button_height, self.button_height))
         # hl_pos = highlight positions
         self.mode_hl_pos = {
             'multiplayer' : (self.multiplayer_pos[0] + self.button_width//2 + self.DISPLAY_HEIGHT//40, self.multiplayer_pos[1] - self.button_height//2),
@@ -240,7 +241,7 @@ class GameModeMenu(Menu):
         self.add_button(self.precision_pos, "Plate_Wide.png", "Hover_Plate_Wide.png", self.button_width, self.button_height, 'precision')
         self.add_button(self.custom_pos, "Plate_Wide.png", "Hover_Plate_Wide.png", self.button_width, self.button_height, 'custom')
 
-        self.highlight = pygame.transform.scale(pygame.image.load(os.path.join('resources', "Confirm_Button.png")), (self.button_height, self.button_height))
+        self.highlight = get_image("Confirm_Button.png", (self.button_height, self.button_height))
         # hl_pos = highlight positions
         self.mode_hl_pos = {
             'standard' : (self.standard_pos[0] + self.button_width//2 + self.DISPLAY_HEIGHT//40, self.standard_pos[1] - self.button_height//2),
@@ -322,7 +323,7 @@ class CustomMenu(Menu):
         self.columns_pos = (self.mid_w, self.mid_h + self.button_buffer)
         self.connect_pos = (self.mid_w, self.mid_h + 2*self.button_buffer)
         self.button_buffer += self.button_width//2
-        self.plate = pygame.transform.scale(pygame.image.load(os.path.join('resources', "Plate_Wide.png")), (self.button_width, self.button_height))
+        self.plate = get_image("Plate_Wide.png", (self.button_width, self.button_height))
 
         self.add_button(self.back_pos, "Back_Button.png", "Hover_Back_Button.png", self.button_height, self.button_height, 'back')
         self.add_button((self.rows_pos[0] - self.button_buffer, self.rows_pos[1]), "Left_Button.png", "Hover_Left_Button.png", self.button_height, self.button_height, 'rows_left')
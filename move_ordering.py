@@ -0,0 +1,91 @@
+# Decides which columns the minimax search tries first, the sooner the best move is tried the more alpha-beta can prune
+class MoveOrderer:
+    def __init__(self, point_board):
+        self.rows, self.cols = point_board.shape
+
+        # Columns that cover the most potential lines go first, ties go to whichever is closer to the centre
+        centre = (self.cols - 1) / 2
+        column_points = [int(point_board[:, j].sum()) for j in range(self.cols)]
+        self.static_order = sorted(range(self.cols), key=lambda j: (-column_points[j], abs(j - centre)))
+        # bonus that breaks ties between moves with the same history score
+        self.static_bonus = [0] * self.cols
+        for rank, col in enumerate(self.static_order):
+            self.static_bonus[col] = self.cols - rank
+
+        # Priorities above anything the history table can reach
+        self.TT_MOVE_SCORE = 1 << 62
+        self.KILLER_SCORES = (1 << 61, 1 << 60)
+
+        # Two moves per ply that recently caused a cutoff, indexed by the number of pieces on the board
+        self.killers = [[None, None] for _ in range(self.rows * self.cols + 1)]
+        # How often each column has caused a cutoff for each piece, weighted by the depth it happened at
+        self.history = [None] + [[0] * self.cols for _ in range(2)]
+
+        # Ordered moves and their scores for every ply, filled in place so the search doesn't build a new list each node
+        # A ply's lists are only reused once the search has finished with every node above it
+        self.move_buffers = [[0] * self.cols for _ in range(self.rows * self.cols + 1)]
+        self.score_buffers = [[0] * self.cols for _ in range(self.rows * self.cols + 1)]
+
+    # Killers only make sense for the position they were found in, history is halved so newer cutoffs count for more
+    def new_search(self):
+        for killers in self.killers:
+            killers[0] = killers[1] = None
+        for piece in (1, 2):
+            self.history[piece] = [score // 2 for score in self.history[piece]]
+
+    def order_moves(self, cols, ply, piece, tt_move=None):
+        killers = self.killers[ply]
+        history = self.history[piece]
+
+        def move_score(col):
+            if col == tt_move:
+                return self.TT_MOVE_SCORE
+            if col == killers[0]:
+                return self.KILLER_SCORES[0]
+            if col == killers[1]:
+                return self.KILLER_SCORES[1]
+            return history[col] * (self.cols + 1) + self.static_bonus[col]
+
+        cols.sort(key=move_score, reverse=True)
+        return cols
+
+    # Fills the ply's move buffer with the playable columns of a bitboard, best first, and returns how many there are
+    def fill_moves(self, position, ply, piece, tt_move=None):
+        moves = self.move_buffers[ply]
+        scores = self.score_buffers[ply]
+        killers = self.killers[ply]
+        history = self.history[piece]
+        heights = position.heights
+        rows = position.rows
+        count = 0
+
+        for col in self.static_order:
+            if heights[col] < rows:
+                if col == tt_move:
+                    score = self.TT_MOVE_SCORE
+                elif col == killers[0]:
+                    score = self.KILLER_SCORES[0]
+                elif col == killers[1]:
+                    score = self.KILLER_SCORES[1]
+                else:
+                    score = history[col] * (self.cols + 1) + self.static_bonus[col]
+
+                # insertion sort, there are never more than a handful of columns
+                i = count
+                while i and scores[i-1] < score:
+                    moves[i] = moves[i-1]
+                    scores[i] = scores[i-1]
+                    i -= 1
+                moves[i] = col
+                scores[i] = score
+                count += 1
+
+        return count
+
+    # Called when a move makes the search stop looking at its siblings
+    def record_cutoff(self, col, ply, piece, depth):
+        killers = self.killers[ply]
+        if killers[0] != col:
+            killers[1] = killers[0]
+            killers[0] = col
+        self.history[piece][col] += depth * depth
@@ -0,0 +1,156 @@
+import os
+import mmap
+import struct
+import time
+import argparse
+import numpy as np
+from bitboard import BitBoard
+from transposition import get_zobrist_keys
+
+
+# Book files are a header followed by every key in ascending order (little endian uint64) and then a column (uint8) per key
+BOOK_MAGIC = b'C4BK'
+BOOK_VERSION = 1
+# magic, version, rows, columns, connect amount, number of entries
+BOOK_HEADER = struct.Struct('<4sHBBB3xI')
+
+
+# Exact books only hold moves the solver proved, the others hold the best move a heuristic search found
+def get_book_path(rows, cols, connect_amount, exact=False):
+    suffix = '_exact' if exact else ''
+    return os.path.join('resources', f"opening_book_{rows}x{cols}x{connect_amount}{suffix}.bin")
+
+
+# Books store moves for a certain player to move, since a missed disc means either player can be next with the same board
+def get_book_key(position, piece_to_move):
+    side_key = get_zobrist_keys(position.rows, position.cols)[1]
+    return position.hash ^ side_key if piece_to_move == 2 else position.hash
+
+
+# Read only view of a book file, the file is memory mapped the first time a move is looked up
+class OpeningBook:
+    def __init__(self, path, rows, cols, connect_amount):
+        self.path = path
+        self.rows = rows
+        self.cols = cols
+        self.connect_amount = connect_amount
+
+        self.loaded = False
+        self.book_map = None
+        self.keys = None
+        self.moves = None
+
+    def load(self):
+        self.loaded = True
+        # Games without a book just fall back to searching
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb') as file:
+            self.book_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rows, cols, connect_amount, entries = BOOK_HEADER.unpack_from(self.book_map)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION or (rows, cols, connect_amount) != (self.rows, self.cols, self.connect_amount):
+            return
+
+        self.keys = np.frombuffer(self.book_map, dtype='<u8', count=entries, offset=BOOK_HEADER.size)
+        self.moves = np.frombuffer(self.book_map, dtype=np.uint8, count=entries, offset=BOOK_HEADER.size + 8*entries)
+
+    # Returns the book's column for the position, or None if the position isn't in the book
+    def lookup(self, position, piece_to_move):
+        if not self.loaded:
+            self.load()
+        if self.keys is None or len(self.keys) == 0:
+            return None
+
+        key = np.uint64(get_book_key(position, piece_to_move))
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            col = int(self.moves[i])
+            if position.can_play(col):
+                return col
+        return None
+
+
+# Books are opened once and shared by every cpu that plays on the same sized board
+opening_books = {}
+
+def get_opening_book(rows, cols, connect_amount, exact=False):
+    key = (rows, cols, connect_amount, exact)
+    if key not in opening_books:
+        opening_books[key] = OpeningBook(get_book_path(rows, cols, connect_amount, exact), rows, cols, connect_amount)
+    return opening_books[key]
+
+
+def write_book(path, rows, cols, connect_amount, book_moves):
+    keys = np.array(sorted(book_moves), dtype='<u8')
+    moves = np.array([book_moves[key] for key in sorted(book_moves)], dtype=np.uint8)
+    with open(path, 'wb') as file:
+        file.write(BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, rows, cols, connect_amount, len(keys)))
+        file.write(keys.tobytes())
+        file.write(moves.tobytes())
+
+
+# Searches every position that can come up in the first few moves, with either colour starting
+# Mirrored positions share a search, so each position costs about half as much
+# An exact book solves each position instead, positions the solver can't finish within the time limit are left out
+def generate_book(rows, cols, connect_amount, plies, time_limit, exact=False):
+    # imported here so reading a book never needs the search
+    from engine import Engine
+    from solver import Solver
+
+    engines = {}
+    solver = None
+    if exact:
+        solver = Solver(rows, cols, connect_amount, tt_megabytes=256)
+    else:
+        for piece in (1, 2):
+            engines[piece] = Engine(rows, cols, connect_amount, piece, 'extreme', workers=1)
+            engines[piece].time_limit = time_limit
+    book_moves = {}
+    # positions the solver ran out of time on, so their mirror images aren't tried again
+    unsolved = set()
+
+    def add_position(position, piece_to_move):
+        key = get_book_key(position, piece_to_move)
+        if key in book_moves or key in unsolved or position.is_win(1) or position.is_win(2):
+            return
+        if exact:
+            result = solver.best_move(position, piece_to_move, time_limit=time_limit or None)
+            if result is None:
+                unsolved.add(key)
+                unsolved.add(get_book_key(position.mirrored(), piece_to_move))
+                return
+            col = result[0]
+        else:
+            col = engines[piece_to_move].iterative_deepening(position.copy())
+        book_moves[key] = col
+        book_moves[get_book_key(position.mirrored(), piece_to_move)] = cols-1 - col
+
+    def visit(position, piece_to_move):
+        add_position(position, piece_to_move)
+        if position.moves_played + 1 < plies:
+            for col in position.valid_cols():
+                position.play(col, piece_to_move)
+                visit(position, 1 if piece_to_move == 2 else 2)
+                position.undo()
+
+    for first_piece in (1, 2):
+        visit(BitBoard(rows, cols, connect_amount), first_piece)
+    return book_moves
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds an opening book for the cpu')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--cols', type=int, default=7)
+    parser.add_argument('--connect', type=int, default=4)
+    parser.add_argument('--plies', type=int, default=5, help='positions with fewer discs than this are put in the book')
+    parser.add_argument('--time', type=float, default=1.0, help='seconds of search for each position, 0 lets the solver take as long as it needs')
+    parser.add_argument('--exact', action='store_true', help='solve every position for the perfect cpu instead of searching')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    book_moves = generate_book(args.rows, args.cols, args.connect, args.plies, args.time, args.exact)
+    path = get_book_path(args.rows, args.cols, args.connect, args.exact)
+    write_book(path, args.rows, args.cols, args.connect, book_moves)
+    print(f"Wrote {len(book_moves)} positions to {path} in {time.time() - start_time:.0f}s")
@@ -0,0 +1,164 @@
+import math
+import threading
+import pymunk
+from engine import get_search_pool
+
+
+# Plain copy of everything a shot's physics depends on, so it can be rebuilt without pygame or sent to another process
+def get_board_snapshot(game):
+    frame = []
+    for shape in game.board.frame:
+        body = shape.body
+        frame.append({
+            'body_type' : body.body_type,
+            'position' : tuple(body.position),
+            'vertices' : [tuple(vertex) for vertex in shape.get_vertices()],
+            'elasticity' : shape.elasticity,
+            'friction' : shape.friction
+        })
+
+    return {
+        'gravity' : game.VERT_GRAVITY_VAL,
+        'damping' : game.DAMPING_VAL,
+        'step_size' : game.STEP_SIZE,
+        'window_height' : game.WINDOW_HEIGHT,
+        'disc_dist_tol' : game.disc_dist_tol,
+        'launch_factor' : game.disc_launch_factor,
+        'max_line_dist' : game.aim_line_max_dis,
+        'disc_radius' : game.board.DISC_RADIUS,
+        'disc_mass' : game.Disc.MASS,
+        'disc_elasticity' : game.Disc.ELASTICITY,
+        'disc_friction' : game.Disc.FRICTION,
+        'frame' : frame,
+        # discs already set into the board are treated as part of the frame
+        'settled_discs' : [tuple(disc.body.position) for disc in game.disc_group if disc.set_in_board],
+        'query_points' : list(game.board.query_points)
+    }
+
+
+# Everything in a snapshot except the settled discs, simulators built from snapshots with the same key can be reused
+def get_frame_key(snapshot):
+    return repr({name : value for name, value in snapshot.items() if name != 'settled_discs'})
+
+
+# Runs launches in pymunk with nothing drawn and no frame rate cap, and reports which column each disc settles in
+# Spaces holding a copy of the frame are kept in a pool and reused, so a shot only adds and removes its own disc and the settled ones
+class ShotSimulator:
+    def __init__(self, snapshot, max_steps=1500):
+        self.snapshot = snapshot
+        # shots that are still moving after this many steps count as a miss
+        self.max_steps = max_steps
+
+        self.pool = []
+        # the game and the cpu's search thread can both be simulating
+        self.pool_lock = threading.Lock()
+
+    def build_space(self):
+        snapshot = self.snapshot
+        space = pymunk.Space()
+        space.gravity = (0, snapshot['gravity'])
+        space.damping = snapshot['damping']
+
+        # static walls and the kinematic base, the base only moves while the game resets
+        for piece in snapshot['frame']:
+            body = pymunk.Body(body_type=piece['body_type'])
+            body.position = piece['position']
+            shape = pymunk.Poly(body, piece['vertices'])
+            shape.elasticity = piece['elasticity']
+            shape.friction = piece['friction']
+            space.add(body, shape)
+
+        return space
+
+    def acquire_space(self):
+        with self.pool_lock:
+            if self.pool:
+                return self.pool.pop()
+        return self.build_space()
+
+    def release_space(self, space):
+        with self.pool_lock:
+            self.pool.append(space)
+
+    # Velocity the game launches a disc at when an aim line is dragged from origin to endpoint, rounded the same way
+    def get_aimed_velocity(self, origin, endpoint):
+        x_dif = round(endpoint[0]) - origin[0]
+        y_dif = round(endpoint[1]) - origin[1]
+        power = round(math.sqrt(x_dif**2 + y_dif**2) / (self.snapshot['max_line_dist']/100), 1)
+        angle = math.atan2(y_dif, x_dif)
+        return (-math.cos(angle) * power * self.snapshot['launch_factor'], -math.sin(angle) * power * self.snapshot['launch_factor'])
+
+    # Column the disc settles in, or None if it misses the board
+    # settled_discs are the positions of the discs already set into the board, the snapshot's by default
+    def simulate(self, start, velocity, settled_discs=None):
+        snapshot = self.snapshot
+        radius = snapshot['disc_radius']
+        if settled_discs is None:
+            settled_discs = snapshot['settled_discs']
+        space = self.acquire_space()
+
+        # discs already set into the board are treated as part of the frame
+        settled = []
+        for position in settled_discs:
+            settled_body = pymunk.Body(body_type=pymunk.Body.STATIC)
+            settled_body.position = position
+            settled_shape = pymunk.Circle(settled_body, radius)
+            settled_shape.elasticity = snapshot['disc_elasticity']
+            settled_shape.friction = snapshot['disc_friction']
+            space.add(settled_body, settled_shape)
+            settled += [settled_body, settled_shape]
+
+        body = pymunk.Body(snapshot['disc_mass'], pymunk.moment_for_circle(snapshot['disc_mass'], 0, radius), body_type=pymunk.Body.DYNAMIC)
+        body.position = start
+        body.velocity = velocity
+        shape = pymunk.Circle(body, radius)
+        shape.elasticity = snapshot['disc_elasticity']
+        shape.friction = snapshot['disc_friction']
+        space.add(body, shape)
+
+        col = None
+        try:
+            # Same checks the game loop makes after each step
+            last_position = body.position
+            for _ in range(self.max_steps):
+                space.step(snapshot['step_size'])
+                position = body.position
+                if position[1] - radius > snapshot['window_height']:
+                    break
+                if math.dist(last_position, position) < snapshot['disc_dist_tol']:
+                    for i, point in enumerate(snapshot['query_points']):
+                        if shape.point_query(point).distance < 0:
+                            col = i
+                            break
+                    break
+                last_position = position
+        finally:
+            space.remove(body, shape, *settled)
+            self.release_space(space)
+
+        return col
+
+    # Simulates every velocity from the same start, split between a pool of processes when workers > 1
+    def simulate_batch(self, start, velocities, workers=1, settled_discs=None):
+        velocities = [tuple(velocity) for velocity in velocities]
+        if settled_discs is None:
+            settled_discs = self.snapshot['settled_discs']
+        if workers <= 1 or len(velocities) < 2:
+            return [self.simulate(start, velocity, settled_discs) for velocity in velocities]
+
+        pool = get_search_pool(workers)
+        chunk_size = math.ceil(len(velocities) / workers)
+        futures = [pool.submit(simulate_shots, self.snapshot, self.max_steps, start, velocities[i:i + chunk_size], settled_discs) for i in range(0, len(velocities), chunk_size)]
+        return [col for future in futures for col in future.result()]
+
+
+# Simulators kept by each worker process, so a frame's spaces are only built once per process
+worker_simulators = {}
+
+def simulate_shots(snapshot, max_steps, start, velocities, settled_discs):
+    key = (get_frame_key(snapshot), max_steps)
+    if key not in worker_simulators:
+        worker_simulators.clear()
+        worker_simulators[key] = ShotSimulator(snapshot, max_steps)
+    simulator = worker_simulators[key]
+    return [simulator.simulate(start, velocity, settled_discs) for velocity in velocities]
@@ -0,0 +1,231 @@
+import time
+import threading
+from array import array
+from bitboard import popcount
+
+
+# Raised to abandon a solve that has used up its budget
+class SolverBudgetExceeded(Exception):
+    pass
+
+
+# Works out the exact result of a position when both players play perfectly
+# Positions are (current, mask, moves) where current holds the player to move's discs and mask holds every disc
+# Scores are from the point of view of the player to move, positive wins, negative loses and 0 draws,
+# the further a score is from 0 the sooner the game ends
+class Solver:
+    def __init__(self, rows, cols, connect_amount, tt_megabytes=32):
+        self.rows = rows
+        self.cols = cols
+        self.connect_amount = connect_amount
+        self.col_height = self.rows + 1
+        self.cells = self.rows * self.cols
+
+        self.bottom_mask = sum(1 << (col*self.col_height) for col in range(self.cols))
+        self.board_mask = self.bottom_mask * ((1 << self.rows) - 1)
+        self.column_masks = [((1 << self.rows) - 1) << (col*self.col_height) for col in range(self.cols)]
+        self.top_masks = [1 << (self.rows-1 + col*self.col_height) for col in range(self.cols)]
+        # Bit shifts to each of the other cells of a line, along a vertical, horizontal, positive diagonal and negative diagonal line
+        directions = (1, self.col_height, self.col_height + 1, self.col_height - 1)
+        self.line_offsets = [[shift * i for i in range(1, self.connect_amount)] for shift in directions]
+
+        # Centre columns first, they take part in the most lines
+        centre = (self.cols - 1) / 2
+        self.move_order = sorted(range(self.cols), key=lambda col: abs(col - centre))
+
+        # Loose bounds on any score, a player to move can't win with fewer than half the empty cells left
+        self.MIN_SCORE = -(self.cells // 2) - 1
+        self.MAX_SCORE = (self.cells + 1) // 2 + 1
+
+        # Transposition table stored in two flat arrays, keys need up to 64 bits and values fit in a byte
+        # A value of 0 is empty, upper bounds are stored from 1 upwards and lower bounds above those
+        self.tt_size = max(1, int(tt_megabytes * 1024 * 1024) // 9)
+        self.tt_keys = array('Q', bytes(8 * self.tt_size))
+        self.tt_values = array('B', bytes(self.tt_size))
+        self.LOWER_BOUND_OFFSET = self.MAX_SCORE - self.MIN_SCORE + 1
+
+        self.nodes = 0
+        self.node_limit = None
+        self.deadline = None
+        # called now and then during a solve, returning True abandons it
+        self.should_stop = None
+        # solvers are shared, a cancelled solve may still be finishing when the next one starts
+        self.lock = threading.Lock()
+
+    # Bits of every empty cell that would complete a line for the discs in position
+    def winning_cells(self, position, mask):
+        cells = 0
+        connect_amount = self.connect_amount
+        for offsets in self.line_offsets:
+            # behind[j] has the cells with j discs in a row just behind them and ahead[j] the cells with j in front
+            behind = [-1]
+            ahead = [-1]
+            run = -1
+            for offset in offsets:
+                run &= position << offset
+                behind.append(run)
+            run = -1
+            for offset in offsets:
+                run &= position >> offset
+                ahead.append(run)
+            for k in range(connect_amount):
+                cells |= behind[k] & ahead[connect_amount-1 - k]
+        return cells & (self.board_mask ^ mask)
+
+    # Bits of the cells that can be played into
+    def possible(self, mask):
+        return (mask + self.bottom_mask) & self.board_mask
+
+    def can_win_next(self, current, mask):
+        return self.winning_cells(current, mask) & self.possible(mask)
+
+    # Moves that don't hand the opponent a win on their next turn, 0 if every move loses
+    def non_losing_moves(self, current, mask):
+        possible_mask = self.possible(mask)
+        opponent_win = self.winning_cells(current ^ mask, mask)
+        forced_moves = possible_mask & opponent_win
+        if forced_moves:
+            # the opponent has two threats, only one can be blocked
+            if forced_moves & (forced_moves - 1):
+                return 0
+            possible_mask = forced_moves
+        # playing right below an opponent's winning cell lets them play into it
+        return possible_mask & ~(opponent_win >> 1)
+
+    def check_budget(self):
+        self.nodes += 1
+        if self.node_limit and self.nodes > self.node_limit:
+            raise SolverBudgetExceeded()
+        # checking the clock every node would slow the solver down
+        if self.nodes % 1024 == 0:
+            if (self.deadline and time.perf_counter() > self.deadline) or (self.should_stop and self.should_stop()):
+                raise SolverBudgetExceeded()
+
+    # Expects that the player to move can't win straight away, alpha < beta
+    def negamax(self, current, mask, moves, alpha, beta):
+        self.check_budget()
+
+        next_moves = self.non_losing_moves(current, mask)
+        if not next_moves:
+            return -((self.cells - moves) // 2)
+        if moves >= self.cells - 2:
+            return 0
+
+        # the opponent can't win with their next move
+        lower = -((self.cells - 2 - moves) // 2)
+        if alpha < lower:
+            alpha = lower
+            if alpha >= beta:
+                return alpha
+
+        upper = (self.cells - 1 - moves) // 2
+        key = current + mask
+        index = key % self.tt_size
+        if self.tt_keys[index] == key:
+            value = self.tt_values[index]
+            if value > self.LOWER_BOUND_OFFSET:
+                lower = value - self.LOWER_BOUND_OFFSET + self.MIN_SCORE - 1
+                if alpha < lower:
+                    alpha = lower
+                    if alpha >= beta:
+                        return alpha
+            elif value:
+                upper = value + self.MIN_SCORE - 1
+        if beta > upper:
+            beta = upper
+            if alpha >= beta:
+                return beta
+
+        # Moves that set up the most new threats go first
+        ordered_moves = []
+        for rank, col in enumerate(self.move_order):
+            move = next_moves & self.column_masks[col]
+            if move:
+                threats = popcount(self.winning_cells(current | move, mask))
+                ordered_moves.append((-threats, rank, move))
+        ordered_moves.sort()
+
+        for _, _, move in ordered_moves:
+            score = -self.negamax(current ^ mask, mask | move, moves + 1, -beta, -alpha)
+            if score >= beta:
+                self.tt_keys[index] = key
+                self.tt_values[index] = score - self.MIN_SCORE + 1 + self.LOWER_BOUND_OFFSET
+                return score
+            if score > alpha:
+                alpha = score
+
+        self.tt_keys[index] = key
+        self.tt_values[index] = alpha - self.MIN_SCORE + 1
+        return alpha
+
+    # Narrows down the exact score with null window searches
+    def solve(self, current, mask, moves):
+        if self.can_win_next(current, mask):
+            return (self.cells + 1 - moves) // 2
+
+        low = -((self.cells - moves) // 2)
+        high = (self.cells + 1 - moves) // 2
+        while low < high:
+            middle = low + (high - low) // 2
+            # leans towards 0 first since most positions are close to a draw
+            if middle <= 0 and -(-low // 2) < middle:
+                middle = -(-low // 2)
+            elif middle >= 0 and high // 2 > middle:
+                middle = high // 2
+            result = self.negamax(current, mask, moves, middle, middle + 1)
+            if result <= middle:
+                high = result
+            else:
+                low = result
+        return low
+
+    # Returns (column, score) for the player to move of a bitboard, or None if the budget runs out first
+    def best_move(self, position, piece_to_move, node_limit=None, time_limit=None, should_stop=None):
+        with self.lock:
+            self.nodes = 0
+            self.node_limit = node_limit
+            self.deadline = time.perf_counter() + time_limit if time_limit else None
+            self.should_stop = should_stop
+            return self.find_best_move(position, piece_to_move)
+
+    def find_best_move(self, position, piece_to_move):
+        current = position.masks[piece_to_move]
+        mask = position.masks[1] | position.masks[2]
+        moves = position.moves_played
+        playable = [col for col in self.move_order if not mask & self.top_masks[col]]
+        if not playable:
+            return None
+
+        winning = self.winning_cells(current, mask) & self.possible(mask)
+        for col in playable:
+            if winning & self.column_masks[col]:
+                return col, (self.cells + 1 - moves) // 2
+
+        non_losing = self.non_losing_moves(current, mask)
+        if not non_losing:
+            # every move loses, blocking one of the threats at least makes the opponent find the other
+            opponent_win = self.winning_cells(current ^ mask, mask) & self.possible(mask)
+            for col in playable:
+                if opponent_win & self.column_masks[col]:
+                    return col, -((self.cells - moves) // 2)
+            return playable[0], -((self.cells - moves) // 2)
+
+        try:
+            score = self.solve(current, mask, moves)
+            # The first move that keeps the score is a best move
+            for col in playable:
+                move = non_losing & self.column_masks[col]
+                if move and -self.negamax(current ^ mask, mask | move, moves + 1, -score, -score + 1) >= score:
+                    return col, score
+        except SolverBudgetExceeded:
+            return None
+        return None
+
+
+# Solvers are kept for every board size so their transposition tables carry on between games
+solvers = {}
+
+def get_solver(rows, cols, connect_amount):
+    if (rows, cols, connect_amount) not in solvers:
+        solvers[(rows, cols, connect_amount)] = Solver(rows, cols, connect_amount)
+    return solvers[(rows, cols, connect_amount)]
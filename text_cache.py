@@ -0,0 +1,29 @@
+from collections import OrderedDict
+import pygame
+
+
+# Fonts by (name, size), SysFont searches the system's fonts every time it is called so each font is only made once
+fonts = {}
+
+def get_font(name, size):
+    if (name, size) not in fonts:
+        fonts[(name, size)] = pygame.font.SysFont(name, size)
+    return fonts[(name, size)]
+
+
+# Rendered text by (font, text, colour, antialias), the least recently used is dropped once there are RENDERED_TEXT_LIMIT
+# The same surfaces are handed out every time, so they are only ever blitted and never drawn on
+RENDERED_TEXT_LIMIT = 256
+rendered_text = OrderedDict()
+
+def render_text(font, text, colour, antialias=True):
+    key = (font, text, tuple(colour), bool(antialias))
+    if key in rendered_text:
+        rendered_text.move_to_end(key)
+        return rendered_text[key]
+
+    surface = font.render(text, antialias, colour)
+    rendered_text[key] = surface
+    if len(rendered_text) > RENDERED_TEXT_LIMIT:
+        rendered_text.popitem(last=False)
+    return surface
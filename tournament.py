@@ -0,0 +1,224 @@
+import os
+import time
+import random
+import argparse
+import itertools
+import concurrent.futures
+import multiprocessing
+from bitboard import BitBoard
+from engine import Engine
+
+
+DIFFICULTIES = ('easy', 'medium', 'extreme', 'perfect')
+# Same rows, columns and connect amount as Catapult_4.game_modes
+GAME_MODES = {
+    'standard' : (6, 7, 4),
+    'precision' : (5, 1, 8),
+    'practise' : (6, 7, 8)
+}
+
+
+# Game modes are given by name or as rows x columns x connect amount for a custom board, like 5x6x4
+def parse_game_mode(text):
+    if text in GAME_MODES:
+        return GAME_MODES[text]
+    try:
+        rows, cols, connect_amount = (int(value) for value in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' isn't a game mode or rows x columns x connect amount")
+    if rows < 1 or cols < 1 or connect_amount < 1:
+        raise argparse.ArgumentTypeError(f"'{text}' needs at least one row, column and disc to connect")
+    return (rows, cols, connect_amount)
+
+
+# Both sides of a game are given as (moves, think time, nodes) along with the outcome
+# winner is the index of the winning difficulty in the pairing, -1 for a draw or None if the game didn't finish
+# A physics game that ends before the second side's first turn never makes its cpu, so that side has no stats
+def get_side_stats(engine):
+    if engine is None:
+        return (0, 0, 0)
+    return (engine.moves_chosen, engine.total_think_time, engine.total_nodes)
+
+
+# Plays a game on a bitboard, each cpu's chosen column always lands
+# A cpu that picks a full column (like easy or medium at random) loses its turn, the same as a disc that misses the board
+def play_board_game(game_mode, pairing, first, seed):
+    random.seed(seed)
+    rows, cols, connect_amount = game_mode
+    precision = game_mode == GAME_MODES['precision']
+
+    # the side at index first plays yellow, who moves first
+    pieces = (2, 1) if first == 0 else (1, 2)
+    engines = [Engine(rows, cols, connect_amount, pieces[i], pairing[i], workers=1) for i in range(2)]
+    position = BitBoard(rows, cols, connect_amount)
+
+    winner = None
+    side = first
+    # enough turns for every cell to be filled even if most of them are missed
+    for _ in range(rows * cols * 10):
+        piece = pieces[side]
+        col = engines[side].choose_col(position.copy())
+        if position.can_play(col):
+            position.play(col, piece)
+            if precision:
+                won = bin(position.masks[piece]).count('1') > rows//2
+            else:
+                won = position.is_win(piece)
+            if won:
+                winner = side
+                break
+            if position.is_full():
+                winner = -1
+                break
+        side = 1 - side
+
+    return {'pairing' : pairing, 'winner' : winner, 'stats' : [get_side_stats(engine) for engine in engines], 'steps' : 0}
+
+
+# Plays the other side of a physics game with a second cpu, rebuilt whenever the game builds a new board
+class CPUInput:
+    def __init__(self, difficulty):
+        self.difficulty = difficulty
+        self.board = None
+        self.cpu = None
+
+    def __call__(self, game):
+        # imported here so board only tournaments never load pygame
+        from cpu import CPU
+        if self.board is not game.board:
+            self.board = game.board
+            piece = game.YELLOW_PIECE if game.cpu_piece == game.RED_PIECE else game.RED_PIECE
+            spawn = game.YELLOW_SPAWN if piece == game.YELLOW_PIECE else game.RED_SPAWN
+            self.cpu = CPU(game, piece, spawn, self.difficulty, workers=1)
+        return self.cpu.get_next_move(shot_snapshot=self.cpu.get_shot_snapshot())
+
+
+# Headless games kept by each worker process, building the game loads its images and fonts
+worker_games = {}
+
+# Plays a whole headless game with the physics, so the aim noise and missed discs of get_next_move count too
+def play_physics_game(game_mode, pairing, width, height, max_steps, seed):
+    from game import Catapult_4
+    random.seed(seed)
+
+    if (width, height) not in worker_games:
+        worker_games[(width, height)] = Catapult_4(width, height, headless=True)
+    game = worker_games[(width, height)]
+    cpu_input = CPUInput(pairing[1])
+    game.input_source = cpu_input
+    game.vs_cpu = True
+    game.cpu_difficulty = pairing[0]
+    # the tournament's own processes already use every core
+    game.cpu_workers = 1
+    game.game_mode = game_mode
+
+    result = game.play_headless_game(max_steps)
+    if result is None:
+        winner = None
+    elif result == 0:
+        winner = -1
+    else:
+        winner = 0 if result == game.cpu_piece else 1
+
+    return {'pairing' : pairing, 'winner' : winner, 'stats' : [get_side_stats(game.cpu), get_side_stats(cpu_input.cpu)], 'steps' : game.steps}
+
+
+def play_game(task):
+    if task['physics']:
+        return play_physics_game(task['game_mode'], task['pairing'], task['width'], task['height'], task['max_steps'], task['seed'])
+    return play_board_game(task['game_mode'], task['pairing'], task['first'], task['seed'])
+
+
+# Every pairing of the difficulties, each difficulty also plays itself
+def get_tasks(game_mode, difficulties, games, physics, width, height, max_steps, seed):
+    tasks = []
+    for pairing in itertools.combinations_with_replacement(difficulties, 2):
+        for i in range(games):
+            tasks.append({
+                'game_mode' : game_mode,
+                'pairing' : pairing,
+                # sides take turns going first
+                'first' : i % 2,
+                'physics' : physics,
+                'width' : width,
+                'height' : height,
+                'max_steps' : max_steps,
+                'seed' : seed + len(tasks)
+            })
+    return tasks
+
+
+def run_tournament(tasks, workers):
+    if workers <= 1:
+        return [play_game(task) for task in tasks]
+    # spawned rather than forked, the same as the search pools
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(play_game, tasks))
+
+
+def print_report(results, elapsed):
+    pairings = {}
+    # moves, think time and nodes for each difficulty across every game it played
+    totals = {}
+    steps = 0
+    for result in results:
+        pairing = result['pairing']
+        # wins for each side, draws and unfinished games
+        counts = pairings.setdefault(pairing, [0, 0, 0, 0])
+        if result['winner'] is None:
+            counts[3] += 1
+        elif result['winner'] == -1:
+            counts[2] += 1
+        else:
+            counts[result['winner']] += 1
+
+        for difficulty, stats in zip(pairing, result['stats']):
+            total = totals.setdefault(difficulty, [0, 0, 0])
+            for i in range(3):
+                total[i] += stats[i]
+        steps += result['steps']
+
+    for pairing, (wins_a, wins_b, draws, unfinished) in pairings.items():
+        games = sum((wins_a, wins_b, draws, unfinished))
+        line = f"{pairing[0]:>8} vs {pairing[1]:<8} {games:>4} games   {pairing[0]} {wins_a/games:6.1%}   {pairing[1]} {wins_b/games:6.1%}   draws {draws/games:6.1%}"
+        if unfinished:
+            line += f"   unfinished {unfinished/games:6.1%}"
+        print(line)
+
+    print()
+    print(f"{'difficulty':>10} {'moves':>8} {'think ms':>10} {'nodes/s':>10}")
+    for difficulty in DIFFICULTIES:
+        if difficulty in totals:
+            moves, think_time, nodes = totals[difficulty]
+            think_ms = 1000 * think_time / moves if moves else 0
+            nodes_per_second = nodes / think_time if think_time else 0
+            print(f"{difficulty:>10} {moves:>8} {think_ms:>10.2f} {nodes_per_second:>10.0f}")
+
+    print()
+    line = f"{len(results)} games in {elapsed:.1f}s, {len(results)/elapsed:.2f} games/s"
+    if steps:
+        line += f", {steps/elapsed:.0f} physics steps/s"
+    print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plays the cpu difficulties against each other to measure their strength and speed')
+    parser.add_argument('--games', type=int, default=10, help='games played by each pairing of difficulties')
+    parser.add_argument('--difficulties', nargs='+', choices=DIFFICULTIES, default=['easy', 'medium', 'extreme'])
+    parser.add_argument('--mode', type=parse_game_mode, default='standard', help='standard, precision, practise or a custom board like 5x6x4')
+    parser.add_argument('--physics', action='store_true', help='launch every disc in a headless game instead of only playing on the board')
+    parser.add_argument('--width', type=int, default=1200, help='window width of physics games')
+    parser.add_argument('--height', type=int, default=600, help='window height of physics games')
+    parser.add_argument('--max-steps', type=int, default=100000, help='physics steps before a game counts as unfinished')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='games played at once, each in its own process')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tasks = get_tasks(args.mode, args.difficulties, args.games, args.physics, args.width, args.height, args.max_steps, args.seed)
+    rows, cols, connect_amount = args.mode
+    print(f"{'Physics' if args.physics else 'Board only'} games on {rows}x{cols} connect {connect_amount}, {args.workers} workers")
+    print()
+
+    start_time = time.perf_counter()
+    results = run_tournament(tasks, args.workers)
+    print_report(results, time.perf_counter() - start_time)
@@ -1,9 +1,65 @@
 import pygame
 import math
+import numpy as np
 
 
+# Offsets and slopes of every checkpoint for each (gravity, damping, time_passed, path_length)
+path_coefficients = {}
+
+# Each checkpoint of a path is an affine function of the launch velocity, along each axis separately:
+# checkpoint = start + offset + slope * initial velocity
+# Steps the model, with damping taken from the x and y velocity separately, for a path launched at (0, 0) and one launched at (1, 1) to find them
+def get_path_coefficients(gravity, damping, time_passed, path_length):
+    key = (gravity, damping, time_passed, path_length)
+    if key not in path_coefficients:
+        d = 1 - damping
+        t = time_passed
+        gravity_vector = np.array([0.0, gravity])
+
+        velocities = np.array([[0.0, 0.0], [1.0, 1.0]])
+        accelerations = gravity_vector - d*velocities
+        positions = np.zeros((2, 2))
+        checkpoints = [positions]
+        for _ in range(path_length):
+            velocities = velocities + accelerations*t
+            accelerations = gravity_vector - d*velocities
+            positions = positions + velocities*t + 0.5*accelerations*(t**2)
+            checkpoints.append(positions)
+
+        # (path_length+1, path, axis)
+        checkpoints = np.array(checkpoints)
+        offsets = checkpoints[:, 0]
+        slopes = checkpoints[:, 1] - offsets
+        offsets.flags.writeable = False
+        slopes.flags.writeable = False
+        path_coefficients[key] = (offsets, slopes)
+    return path_coefficients[key]
+
+
+# Predicts any number of paths from the same starting point at once
+class BatchPathPredictor:
+    def __init__(self, gravity, damping, pos, time_passed=0.05, path_length=55):
+        self.pos = np.array(pos, dtype=np.float64)
+        self.path_length = path_length
+        self.offsets, self.slopes = get_path_coefficients(gravity, damping, time_passed, path_length)
+
+    # Takes an (N, 2) array of initial velocities and gives an (N, path_length+1, 2) array of checkpoints,
+    # the first checkpoint of each path being the starting position
+    def get_checkpoints(self, velocities):
+        velocities = np.asarray(velocities, dtype=np.float64).reshape(-1, 2)
+        return (self.pos + self.offsets) + self.slopes * velocities[:, None, :]
+
+    # Only the last checkpoint of each path, as an (N, 2) array
+    def get_endpoints(self, velocities):
+        velocities = np.asarray(velocities, dtype=np.float64).reshape(-1, 2)
+        return (self.pos + self.offsets[-1]) + self.slopes[-1] * velocities
+
+
+# Predicts a single path, its checkpoints come from a batch of one
 class PathPredictor:
     def __init__(self, gravity, damping, pos, initial_velocity, time_passed=0.05):
+        self.gravity = gravity
+        self.damping = damping
         self.g = gravity # the space.gravity value
         self.d = 1 - damping # the space.damping value
         self.pos_x, self.pos_y = pos
@@ -26,18 +82,10 @@ class PathPredictor:
         self.path_length = 55
 
     def get_checkpoints(self):
-        get_displacement = lambda u, a, t=self.t : u*t + 0.5*a*(t**2)
-        update_velocity = lambda u, a, t=self.t : u + a*t
-
-        for _ in range(self.path_length):
-            self.u_x, self.u_y = map(update_velocity, [self.u_x, self.u_y], [self.a_x, self.a_y])
-
-            self.solve_unkowns()
-            
-            self.pos_x += get_displacement(self.u_x, self.a_x)
-            self.pos_y += get_displacement(self.u_y, self.a_y)
-
-            self.checkpoints.append((self.pos_x, self.pos_y))
+        batch = BatchPathPredictor(self.gravity, self.damping, (self.pos_x, self.pos_y), self.t, self.path_length)
+        path = batch.get_checkpoints((self.u_x, self.u_y))[0]
+        self.checkpoints = [tuple(checkpoint) for checkpoint in path.tolist()]
+        self.pos_x, self.pos_y = self.checkpoints[-1]
 
     def solve_unkowns(self):
         # self.angle = math.atan2(self.u_y, self.u_x)
@@ -55,6 +103,23 @@ class PathPredictor:
             pygame.draw.line(window, colour, self.checkpoints[i], self.checkpoints[i+1], 2)
 
 
+# Works out the launch velocity that lands a path on a point without searching for it
+# A path's last checkpoint is offset + slope * initial velocity along each axis, so this is one division per axis
+class ShotSolver:
+    def __init__(self, gravity, damping, pos, time_passed=0.05):
+        batch = BatchPathPredictor(gravity, damping, pos, time_passed)
+        self.offset = tuple((batch.pos + batch.offsets[-1]).tolist())
+        self.slope = tuple(batch.slopes[-1].tolist())
+
+    # Initial velocity whose last checkpoint is the target
+    def get_velocity(self, target):
+        return ((target[0] - self.offset[0]) / self.slope[0], (target[1] - self.offset[1]) / self.slope[1])
+
+    # Last checkpoint of a path launched with the given velocity, the same as PathPredictor's up to rounding
+    def get_endpoint(self, velocity):
+        return (self.offset[0] + self.slope[0]*velocity[0], self.offset[1] + self.slope[1]*velocity[1])
+
+
 
 if __name__ == '__main__':
     path_predictor = PathPredictor(500, 0.75, (1000, 400), (-400, -600), 0.1)
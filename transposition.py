@@ -0,0 +1,85 @@
+import random
+
+
+# Zobrist keys are generated from a fixed seed so every process and every game agrees on a position's hash
+zobrist_tables = {}
+
+# Returns a random key for every (piece, bit) pair of a board size, plus a key for whose turn it is
+def get_zobrist_keys(rows, cols):
+    if (rows, cols) not in zobrist_tables:
+        rng = random.Random(f"zobrist {rows}x{cols}")
+        bits = (rows + 1) * cols
+        # index 0 is unused so the keys line up with the piece values
+        piece_keys = [None] + [[rng.getrandbits(64) for _ in range(bits)] for _ in range(2)]
+        side_key = rng.getrandbits(64)
+        zobrist_tables[(rows, cols)] = (piece_keys, side_key)
+    return zobrist_tables[(rows, cols)]
+
+
+# Stores the results of previous searches so positions reached through different move orders aren't searched twice
+class TranspositionTable:
+    # How the stored value relates to the position's real value
+    EXACT = 0
+    LOWER_BOUND = 1
+    UPPER_BOUND = 2
+
+    # Rough number of bytes a single entry takes up, including its slot in the list
+    ENTRY_SIZE = 176
+
+    def __init__(self, max_megabytes=16, replacement='two_tier'):
+        # 'depth_preferred' keeps whichever entry was searched deeper
+        # 'two_tier' pairs a depth preferred slot with a slot that is always replaced
+        self.replacement = replacement
+        self.size = max(2, int(max_megabytes * 1024 * 1024) // self.ENTRY_SIZE)
+        if self.replacement == 'two_tier':
+            self.buckets = self.size // 2
+        elif self.replacement == 'depth_preferred':
+            self.buckets = self.size
+        else:
+            raise ValueError(f"Unknown replacement policy: {self.replacement}")
+
+        # Entries are tuples of (key, depth, flag, value, move, generation)
+        self.slots = [None] * self.size
+        # Increased every search so entries left over from earlier moves can be replaced
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.generation = 0
+
+    def probe(self, key):
+        if self.replacement == 'two_tier':
+            index = (key % self.buckets) * 2
+            for entry in (self.slots[index], self.slots[index + 1]):
+                if entry and entry[0] == key:
+                    return entry
+        else:
+            entry = self.slots[key % self.buckets]
+            if entry and entry[0] == key:
+                return entry
+        return None
+
+    def store(self, key, depth, flag, value, move):
+        new_entry = (key, depth, flag, value, move, self.generation)
+
+        if self.replacement == 'two_tier':
+            index = (key % self.buckets) * 2
+            deep_entry = self.slots[index]
+            if self.replaceable(deep_entry, key, depth):
+                # the old deep entry gets a second chance in the always replaced slot
+                if deep_entry and deep_entry[0] != key:
+                    self.slots[index + 1] = deep_entry
+                self.slots[index] = new_entry
+            else:
+                self.slots[index + 1] = new_entry
+        else:
+            index = key % self.buckets
+            if self.replaceable(self.slots[index], key, depth):
+                self.slots[index] = new_entry
+
+    # Entries are kept unless they are for the same position, from an older search or searched less deeply
+    def replaceable(self, entry, key, depth):
+        return entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]